@@ -1,8 +1,34 @@
 import os
+import zlib
+import shutil
+import zipfile
+import fnmatch
 import argparse
-from tqdm import tqdm
+from change import DEFAULT_BACKUP_ARCHIVE, repair_backup_archive
+from materialize import files_identical, run_parallel
 
-def restore_from_backup(directory, recursive=True, remove_backup=False):
+def restore_file(backup_file, remove_backup=False):
+    """
+    用单个备份文件恢复原始文件
+
+    删除备份时直接用 os.replace 原子地覆盖原文件；保留备份时按字节复制。
+    原文件内容已与备份一致时跳过写入。
+
+    Returns:
+        bool: 是否实际写入了原始文件
+    """
+    original_file = backup_file[:-4]  # 移除 .bak 后缀
+    identical = files_identical(backup_file, original_file)
+    if remove_backup:
+        if identical:
+            os.remove(backup_file)
+        else:
+            os.replace(backup_file, original_file)
+    elif not identical:
+        shutil.copyfile(backup_file, original_file)
+    return not identical
+
+def restore_from_backup(directory, recursive=True, remove_backup=False, workers=8):
     """
     从备份文件恢复原始文件
     
@@ -10,6 +36,7 @@ def restore_from_backup(directory, recursive=True, remove_backup=False):
         directory: 要处理的文件夹路径
         recursive: 是否递归处理子文件夹
         remove_backup: 恢复后是否删除备份文件
+        workers: 并发恢复的线程数
     """
     try:
         # 获取所有备份文件
@@ -31,34 +58,23 @@ def restore_from_backup(directory, recursive=True, remove_backup=False):
             return True
 
         restored_count = 0
+        identical_count = 0
         failed_count = 0
 
         print(f"找到 {len(backup_files)} 个备份文件")
-        for backup_file in tqdm(backup_files, desc="恢复文件"):
-            try:
-                # 获取原始文件路径
-                original_file = backup_file[:-4]  # 移除 .bak 后缀
-                
-                # 恢复文件
-                with open(backup_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                with open(original_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                # 如果需要，删除备份文件
-                if remove_backup:
-                    os.remove(backup_file)
-                
-                restored_count += 1
-                
-            except Exception as e:
-                print(f"\n恢复文件 {backup_file} 时出错: {str(e)}")
+        for backup_file, written, error in run_parallel(
+                lambda path: restore_file(path, remove_backup), backup_files, workers,
+                desc="恢复文件"):
+            if error is not None:
+                print(f"\n恢复文件 {backup_file} 时出错: {str(error)}")
                 failed_count += 1
                 continue
+            restored_count += 1
+            if not written:
+                identical_count += 1
 
         print("\n恢复完成!")
-        print(f"成功恢复: {restored_count} 个文件")
+        print(f"成功恢复: {restored_count} 个文件（其中 {identical_count} 个内容未变，未重写）")
         print(f"恢复失败: {failed_count} 个文件")
         if remove_backup:
             print("备份文件已删除")
@@ -71,6 +87,89 @@ def restore_from_backup(directory, recursive=True, remove_backup=False):
 
     return True
 
+def restore_member(archive, info, directory):
+    """
+    从压缩包恢复单个文件，原文件大小和CRC32与备份一致时跳过
+
+    Returns:
+        bool: 是否实际写入了原始文件
+    """
+    original_file = os.path.join(directory, *info.filename.split('/'))
+    try:
+        if os.path.getsize(original_file) == info.file_size:
+            with open(original_file, 'rb') as f:
+                if zlib.crc32(f.read()) == info.CRC:
+                    return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(original_file) or '.', exist_ok=True)
+    with archive.open(info) as src, open(original_file, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return True
+
+def restore_from_archive(directory, archive_path, patterns=None, remove_backup=False, workers=8):
+    """
+    从 change.py 生成的备份压缩包恢复原始文件，无需遍历目录树
+
+    Args:
+        directory: 执行 change.py 时的处理目录，压缩包中的路径相对于该目录
+        archive_path: 备份压缩包路径
+        patterns: 只恢复匹配这些通配符的文件（相对路径，如 "train/*.txt"），为None时全部恢复
+        remove_backup: 全部恢复后是否删除备份压缩包
+        workers: 并发恢复的线程数
+    """
+    try:
+        if not os.path.exists(archive_path):
+            print(f"未找到备份压缩包: {archive_path}")
+            return True
+
+        # change.py 中断时压缩包缺少中央目录，先根据清单重建
+        repaired = repair_backup_archive(archive_path)
+        if repaired:
+            print(f"已根据清单修复中断的备份压缩包（{repaired} 个文件）")
+
+        restored_count = 0
+        identical_count = 0
+        failed_count = 0
+
+        with zipfile.ZipFile(archive_path, 'r') as archive:
+            members = archive.infolist()
+            if patterns:
+                members = [info for info in members
+                           if any(fnmatch.fnmatch(info.filename, pattern) for pattern in patterns)]
+
+            if not members:
+                print("备份压缩包中没有匹配的文件！")
+                return True
+
+            print(f"找到 {len(members)} 个备份文件")
+            for info, written, error in run_parallel(
+                    lambda info: restore_member(archive, info, directory), members, workers,
+                    desc="恢复文件"):
+                if error is not None:
+                    print(f"\n恢复文件 {info.filename} 时出错: {str(error)}")
+                    failed_count += 1
+                    continue
+                restored_count += 1
+                if not written:
+                    identical_count += 1
+
+        # 只有全部成功恢复时才删除压缩包，选择性恢复时保留
+        removed = remove_backup and not patterns and failed_count == 0
+        if removed:
+            os.remove(archive_path)
+
+        print("\n恢复完成!")
+        print(f"成功恢复: {restored_count} 个文件（其中 {identical_count} 个内容未变，未重写）")
+        print(f"恢复失败: {failed_count} 个文件")
+        print("备份压缩包已删除" if removed else "备份压缩包已保留")
+
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+        return False
+
+    return True
+
 def main():
     parser = argparse.ArgumentParser(description='从备份文件恢复原始文件')
     parser.add_argument('--dir', '-d', type=str, required=True,
@@ -79,6 +178,12 @@ def main():
                       help='不递归处理子文件夹')
     parser.add_argument('--remove-backup', '-rm', action='store_true',
                       help='恢复后删除备份文件')
+    parser.add_argument('--workers', '-w', type=int, default=8,
+                      help='并发恢复的线程数（默认: 8）')
+    parser.add_argument('--archive', '-a', nargs='?', const='', default=None,
+                      help=f'从备份压缩包恢复（不指定路径时使用处理目录下的 {DEFAULT_BACKUP_ARCHIVE}）')
+    parser.add_argument('--only', type=str, default=None,
+                      help='仅恢复匹配的文件，用逗号分隔的通配符（相对路径，如 "train/*.txt"），需配合 --archive')
 
     args = parser.parse_args()
 
@@ -86,11 +191,18 @@ def main():
         print("错误：指定的文件夹不存在！")
         return 1
 
-    success = restore_from_backup(
-        args.dir,
-        not args.no_recursive,
-        args.remove_backup
-    )
+    if args.archive is not None:
+        archive_path = args.archive or os.path.join(args.dir, DEFAULT_BACKUP_ARCHIVE)
+        patterns = [p.strip() for p in args.only.split(',')] if args.only else None
+        success = restore_from_archive(args.dir, archive_path, patterns, args.remove_backup,
+                                       args.workers)
+    else:
+        success = restore_from_backup(
+            args.dir,
+            not args.no_recursive,
+            args.remove_backup,
+            args.workers
+        )
     
     return 0 if success else 1
 
@@ -1,7 +1,19 @@
 import os
+import re
+import json
+import zlib
+import struct
+import zipfile
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
+# 压缩包备份模式下默认的备份文件名（位于处理目录下）
+DEFAULT_BACKUP_ARCHIVE = 'label_backup.zip'
+
+# 每行第一个字段（跳过行首空白）
+FIRST_TOKEN_PATTERN = re.compile(rb'^[ \t]*([^\s]+)', re.MULTILINE)
+
 def create_number_mapping(mapping_str):
     """
     解析数字映射关系字符串
@@ -21,7 +33,311 @@ def create_number_mapping(mapping_str):
     except ValueError as e:
         raise ValueError("映射格式错误，应为'旧值:新值,旧值:新值'，例如'23:32,24:33'") from e
 
-def modify_numbers_in_txt_files(directory, number_mapping, recursive=True, backup=True):
+def backup_manifest_path(archive_path):
+    """备份压缩包对应的清单文件路径，清单存在说明上次运行没有正常关闭压缩包"""
+    return archive_path + '.manifest.jsonl'
+
+def repair_backup_archive(archive_path):
+    """
+    根据清单文件重建中断后缺少中央目录的备份压缩包
+
+    清单中每一行记录一个已落盘成员的本地文件头偏移和大小，逐个读出并校验CRC后
+    写入新的压缩包，再替换原文件；最后一行写到一半的记录会被忽略。
+
+    Args:
+        archive_path: 备份压缩包路径
+    Returns:
+        int: 恢复出的文件数，没有清单时返回0
+    """
+    manifest_path = backup_manifest_path(archive_path)
+    if not os.path.exists(manifest_path):
+        return 0
+    if not os.path.exists(archive_path):
+        os.remove(manifest_path)
+        return 0
+
+    entries = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+
+    tmp_path = archive_path + '.repair'
+    recovered = 0
+    with open(archive_path, 'rb') as src, \
+            zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as dst:
+        for entry in entries:
+            src.seek(entry['offset'])
+            header = src.read(30)
+            if len(header) < 30 or header[:4] != b'PK\x03\x04':
+                continue
+            name_len, extra_len = struct.unpack('<2H', header[26:30])
+            src.seek(name_len + extra_len, os.SEEK_CUR)
+            data = src.read(entry['compress_size'])
+            if len(data) < entry['compress_size']:
+                continue
+            if entry['compress_type'] == zipfile.ZIP_DEFLATED:
+                data = zlib.decompress(data, -15)
+            if zlib.crc32(data) != entry['crc']:
+                continue
+            dst.writestr(entry['name'], data)
+            recovered += 1
+    os.replace(tmp_path, archive_path)
+    os.remove(manifest_path)
+    return recovered
+
+class BackupArchive:
+    """
+    将被修改文件的原始内容追加写入单个zip压缩包，代替逐个文件的 .bak 备份
+
+    压缩包中的成员名为相对于处理目录的路径，zip 的中央目录即为清单；
+    已存在于压缩包中的文件不会重复备份，保留最早的原始内容。
+    中央目录只在关闭时写入一次；运行期间每批文件写回之前调用 flush()，
+    把新成员的数据落盘并把它们的位置追加到旁边的清单文件，中断后可据此
+    用 repair_backup_archive() 重建压缩包。
+    """
+
+    def __init__(self, archive_path, base_dir):
+        self.archive_path = archive_path
+        self.base_dir = base_dir
+        repaired = repair_backup_archive(archive_path)
+        if repaired:
+            print(f"已根据清单修复上次中断的备份压缩包（{repaired} 个文件）")
+        self.zip = zipfile.ZipFile(archive_path, 'a', compression=zipfile.ZIP_DEFLATED)
+        self.names = set(self.zip.namelist())
+        self.added = 0
+        # 追加模式会覆盖旧的中央目录，所以已有成员也要先记入清单
+        self.manifest = open(backup_manifest_path(archive_path), 'w', encoding='utf-8')
+        self.flushed = 0
+        self.flush()
+
+    def add(self, file_path, data):
+        """备份一个文件的原始字节内容"""
+        arcname = os.path.relpath(file_path, self.base_dir).replace(os.sep, '/')
+        if arcname in self.names:
+            return False
+        self.zip.writestr(arcname, data)
+        self.names.add(arcname)
+        self.added += 1
+        return True
+
+    def flush(self):
+        """把此前备份的内容和清单落盘，耗时只与本批新增的文件有关"""
+        self.zip.fp.flush()
+        os.fsync(self.zip.fp.fileno())
+        infos = self.zip.infolist()
+        for info in infos[self.flushed:]:
+            self.manifest.write(json.dumps({
+                'name': info.filename,
+                'offset': info.header_offset,
+                'compress_size': info.compress_size,
+                'compress_type': info.compress_type,
+                'crc': info.CRC,
+            }, ensure_ascii=False) + '\n')
+        self.flushed = len(infos)
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+
+    def close(self):
+        """写入中央目录，之后清单不再需要"""
+        self.zip.close()
+        self.manifest.close()
+        os.remove(backup_manifest_path(self.archive_path))
+
+class ClassIdRemapper:
+    """
+    基于字节的类别ID查找表
+
+    预先为整数形式的旧ID（如 b"23"）生成 字节 -> 字节 的映射；遇到其他写法
+    （如 b"23.0"、b"023"）时按 float 解析一次并缓存结果，之后同样只需一次字典查找。
+    """
+
+    def __init__(self, number_mapping):
+        self.number_mapping = number_mapping
+        self.table = {}
+        for old, new in number_mapping.items():
+            if float(old).is_integer():
+                self.table[str(int(old)).encode()] = new.encode()
+
+    def lookup(self, token):
+        """返回 token 映射后的字节，不需要修改时返回None"""
+        try:
+            return self.table[token]
+        except KeyError:
+            pass
+        try:
+            new = self.number_mapping.get(float(token))
+        except ValueError:
+            new = None  # 不是数字，保持原样
+        result = new.encode() if new is not None else None
+        self.table[token] = result
+        return result
+
+def remap_bytes(raw, remapper):
+    """
+    只替换需要修改的行的第一个字段，其余字节（空白、精度格式、换行符）保持不变
+
+    Returns:
+        tuple: (修改后的字节（未修改时为None）, 修改的行数)
+    """
+    pieces = None
+    last = 0
+    modified_lines = 0
+    for match in FIRST_TOKEN_PATTERN.finditer(raw):
+        token = match.group(1)
+        new = remapper.lookup(token)
+        if new is None or new == token:
+            continue
+        if pieces is None:
+            pieces = []
+        start, end = match.span(1)
+        pieces.append(raw[last:start])
+        pieces.append(new)
+        last = end
+        modified_lines += 1
+
+    if pieces is None:
+        return None, 0
+    pieces.append(raw[last:])
+    return b''.join(pieces), modified_lines
+
+def remap_txt_file(file_path, remapper):
+    """
+    读取txt文件并计算映射后的内容
+
+    Args:
+        file_path: txt文件路径
+        remapper: ClassIdRemapper 查找表
+    Returns:
+        tuple: (原始字节, 修改后的字节（未修改时为None）, 修改的行数)
+    """
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    new_raw, modified_lines = remap_bytes(raw, remapper)
+    return raw, new_raw, modified_lines
+
+def write_txt_file(file_path, data):
+    """写回修改后的内容"""
+    with open(file_path, 'wb') as f:
+        f.write(data)
+
+def process_txt_file(file_path, remapper, backup=True, archive=None):
+    """
+    修改单个txt文件中每行第一个数字
+
+    Args:
+        file_path: txt文件路径
+        remapper: ClassIdRemapper 查找表
+        backup: 是否创建备份文件
+        archive: BackupArchive 对象；指定时备份写入压缩包而不是 .bak 文件
+    Returns:
+        tuple: (文件是否被修改, 修改的行数)
+    """
+    raw, new_raw, modified_lines = remap_txt_file(file_path, remapper)
+
+    # 创建备份
+    if backup and archive is None:
+        backup_path = file_path + '.bak'
+        if not os.path.exists(backup_path):
+            write_txt_file(backup_path, raw)
+
+    # 只有在文件确实被修改时才写入
+    if new_raw is not None:
+        if backup and archive is not None:
+            archive.add(file_path, raw)
+        write_txt_file(file_path, new_raw)
+
+    return new_raw is not None, modified_lines
+
+def process_file_chunk(file_paths, number_mapping, backup=True, defer_write=False):
+    """
+    处理一批txt文件（供进程池中的工作进程调用）
+
+    Args:
+        file_paths: 本批次的txt文件路径列表
+        number_mapping: 数字映射字典
+        backup: 是否创建备份文件
+        defer_write: 为True时不写回文件，而是把 (文件路径, 原始字节, 修改后的字节, 修改行数)
+                     交回主进程，由主进程先写入备份压缩包再写回
+    Returns:
+        tuple: (已修改文件数, 修改行数, 跳过文件数, [(文件路径, 错误信息), ...], 待写回列表)
+    """
+    modified_files = 0
+    modified_lines = 0
+    skipped_files = 0
+    errors = []
+    pending = []
+    remapper = ClassIdRemapper(number_mapping)
+
+    for file_path in file_paths:
+        try:
+            if defer_write:
+                raw, new_raw, line_count = remap_txt_file(file_path, remapper)
+                file_modified = new_raw is not None
+                if file_modified:
+                    pending.append((file_path, raw, new_raw, line_count))
+            else:
+                file_modified, line_count = process_txt_file(file_path, remapper, backup)
+            if file_modified:
+                modified_files += 1
+            modified_lines += line_count
+        except Exception as e:
+            errors.append((file_path, str(e)))
+            skipped_files += 1
+
+    return modified_files, modified_lines, skipped_files, errors, pending
+
+def commit_pending(pending, archive):
+    """
+    将一批文件的原始内容写入备份压缩包并落盘，然后再写回修改后的内容
+
+    备份失败的文件不会被写回。
+
+    Returns:
+        tuple: (写回失败的文件数, 这些文件的修改行数, [(文件路径, 错误信息), ...])
+    """
+    failed_files = 0
+    failed_lines = 0
+    errors = []
+    backed_up = []
+    for file_path, raw, new_raw, line_count in pending:
+        try:
+            archive.add(file_path, raw)
+            backed_up.append((file_path, new_raw, line_count))
+        except Exception as e:
+            errors.append((file_path, str(e)))
+            failed_files += 1
+            failed_lines += line_count
+    if not backed_up:
+        return failed_files, failed_lines, errors
+
+    try:
+        archive.flush()
+    except Exception as e:
+        # 备份没有可靠落盘，本批文件都不写回
+        for file_path, _, line_count in backed_up:
+            errors.append((file_path, f"备份压缩包写入失败: {str(e)}"))
+            failed_files += 1
+            failed_lines += line_count
+        return failed_files, failed_lines, errors
+
+    for file_path, new_raw, line_count in backed_up:
+        try:
+            write_txt_file(file_path, new_raw)
+        except Exception as e:
+            errors.append((file_path, str(e)))
+            failed_files += 1
+            failed_lines += line_count
+    return failed_files, failed_lines, errors
+
+def split_into_chunks(items, chunk_size):
+    """将列表按固定大小切分为多个批次"""
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+def modify_numbers_in_txt_files(directory, number_mapping, recursive=True, backup=True,
+                                workers=1, chunk_size=1000, backup_archive=None):
     """
     修改指定文件夹下txt文件中每行第一个数字
     
@@ -30,6 +346,10 @@ def modify_numbers_in_txt_files(directory, number_mapping, recursive=True, backu
         number_mapping: 数字映射字典
         recursive: 是否递归处理子文件夹
         backup: 是否创建备份文件
+        workers: 并行处理的进程数，1 表示在当前进程中顺序处理
+        chunk_size: 多进程模式或压缩包备份模式下每个批次包含的文件数
+        backup_archive: 备份压缩包路径；指定时所有被修改文件的原始内容写入该压缩包，
+                        不再为每个文件创建 .bak
     """
     try:
         # 获取所有需要处理的txt文件
@@ -50,51 +370,69 @@ def modify_numbers_in_txt_files(directory, number_mapping, recursive=True, backu
         modified_lines = 0
         skipped_files = 0
 
-        # 使用tqdm创建进度条
-        for file_path in tqdm(txt_files, desc="处理文件"):
-            try:
-                # 读取文件内容
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-
-                # 创建备份
-                if backup:
-                    backup_path = file_path + '.bak'
-                    if not os.path.exists(backup_path):
-                        with open(backup_path, 'w', encoding='utf-8') as f:
-                            f.writelines(lines)
-
-                # 修改内容
-                new_lines = []
-                file_modified = False
-                
-                for line in lines:
-                    parts = line.strip().split()
-                    if not parts:  # 跳过空行
-                        new_lines.append(line)
-                        continue
-                        
+        archive = None
+        if backup and backup_archive:
+            archive = BackupArchive(backup_archive, directory)
+
+        try:
+            if workers > 1 and len(txt_files) > 1:
+                # 多进程模式：按批次分发，进度条以文件数计
+                chunks = split_into_chunks(txt_files, max(1, chunk_size))
+                defer_write = archive is not None
+                with ProcessPoolExecutor(max_workers=workers) as executor, \
+                        tqdm(total=len(txt_files), desc="处理文件") as pbar:
+                    futures = {
+                        executor.submit(process_file_chunk, chunk, number_mapping,
+                                        backup, defer_write): len(chunk)
+                        for chunk in chunks
+                    }
+                    for future in as_completed(futures):
+                        chunk_modified, chunk_lines, chunk_skipped, errors, pending = future.result()
+                        modified_files += chunk_modified
+                        modified_lines += chunk_lines
+                        skipped_files += chunk_skipped
+                        # 压缩包备份模式：主进程先备份原始内容并落盘，再写回
+                        if pending:
+                            failed_files, failed_lines, commit_errors = commit_pending(pending, archive)
+                            modified_files -= failed_files
+                            modified_lines -= failed_lines
+                            skipped_files += failed_files
+                            errors.extend(commit_errors)
+                        for file_path, error in errors:
+                            print(f"\n处理文件 {file_path} 时出错: {error}")
+                        pbar.update(futures[future])
+            elif archive is not None:
+                # 压缩包备份模式：按批次先备份并落盘，再写回本批文件
+                with tqdm(total=len(txt_files), desc="处理文件") as pbar:
+                    for chunk in split_into_chunks(txt_files, max(1, chunk_size)):
+                        chunk_modified, chunk_lines, chunk_skipped, errors, pending = \
+                            process_file_chunk(chunk, number_mapping, backup, defer_write=True)
+                        failed_files, failed_lines, commit_errors = commit_pending(pending, archive)
+                        modified_files += chunk_modified - failed_files
+                        modified_lines += chunk_lines - failed_lines
+                        skipped_files += chunk_skipped + failed_files
+                        for file_path, error in errors + commit_errors:
+                            print(f"\n处理文件 {file_path} 时出错: {error}")
+                        pbar.update(len(chunk))
+            else:
+                # 使用tqdm创建进度条
+                remapper = ClassIdRemapper(number_mapping)
+                for file_path in tqdm(txt_files, desc="处理文件"):
                     try:
-                        first_number = float(parts[0])
-                        if first_number in number_mapping:
-                            parts[0] = number_mapping[first_number]
-                            file_modified = True
-                            modified_lines += 1
-                    except ValueError:
-                        pass  # 不是数字，保持原样
-                    
-                    new_lines.append(' '.join(parts) + '\n')
-
-                # 只有在文件确实被修改时才写入
-                if file_modified:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.writelines(new_lines)
-                    modified_files += 1
-                
-            except Exception as e:
-                print(f"\n处理文件 {file_path} 时出错: {str(e)}")
-                skipped_files += 1
-                continue
+                        file_modified, line_count = process_txt_file(
+                            file_path, remapper, backup, archive)
+                        if file_modified:
+                            modified_files += 1
+                        modified_lines += line_count
+                    except Exception as e:
+                        print(f"\n处理文件 {file_path} 时出错: {str(e)}")
+                        skipped_files += 1
+                        continue
+        finally:
+            # 中断时也要写入压缩包的中央目录，保证已备份的内容可恢复
+            if archive is not None:
+                archive.close()
+                print(f"\n备份压缩包: {backup_archive}（本次新增 {archive.added} 个文件）")
 
         # 打印统计信息
         print(f"\n处理完成!")
@@ -118,6 +456,14 @@ def main():
                       help='不递归处理子文件夹')
     parser.add_argument('--no-backup', '-nb', action='store_true',default=False,
                       help='不创建备份文件')
+    parser.add_argument('--backup-mode', choices=['bak', 'archive'], default='bak',
+                      help='备份方式：bak（每个文件旁生成 .bak，默认）或 archive（写入单个zip压缩包）')
+    parser.add_argument('--backup-archive', type=str, default=None,
+                      help=f'备份压缩包路径（默认: 处理目录下的 {DEFAULT_BACKUP_ARCHIVE}）')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                      help='并行处理的进程数（默认: 1，即单进程）')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                      help='多进程模式或压缩包备份模式下每批处理的文件数（默认: 1000）')
 
     args = parser.parse_args()
 
@@ -125,17 +471,28 @@ def main():
         print("错误：指定的文件夹不存在！")
         return 1
 
+    if args.workers < 1:
+        print("错误：进程数必须大于等于1！")
+        return 1
+
     try:
         number_mapping = create_number_mapping(args.mapping)
     except ValueError as e:
         print(f"错误：{str(e)}")
         return 1
 
+    backup_archive = None
+    if args.backup_mode == 'archive' or args.backup_archive:
+        backup_archive = args.backup_archive or os.path.join(args.dir, DEFAULT_BACKUP_ARCHIVE)
+
     success = modify_numbers_in_txt_files(
         args.dir,
         number_mapping,
         not args.no_recursive,
-        not args.no_backup
+        not args.no_backup,
+        args.workers,
+        args.chunk_size,
+        backup_archive
     )
     
     return 0 if success else 1
@@ -1,47 +1,232 @@
 import cv2 as cv
 import os
 import numpy as np
-from collections import deque
+import struct
+import hashlib
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import fnmatch
 import argparse
+from tqdm import tqdm
+
+# 对比窗口尺寸（左右各占一半宽度）
+WINDOW_WIDTH, WINDOW_HEIGHT = 2560, 720
+
+# 每个视图缓存的合成帧数量（每帧约 2560x720x3 字节）
+FRAME_CACHE_SIZE = 8
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# 批量渲染的输出形式：逐张图片、缩略图拼版、视频
+RENDER_MODES = ['images', 'sheet', 'video']
+
+def parse_annotations(lines):
+    """
+    将标注行一次性解析为 NumPy 数组，绘制时无需再逐行 split
+
+    每行格式为 "类别ID x1 y1 x2 y2 ..."（归一化坐标），每4个点构成一个四边形。
+
+    Args:
+        lines: 标注文件的行列表
+    Returns:
+        dict: closed 为完整四边形 (N, 4, 2)，classes 为每个四边形的类别ID (N,)，
+              open 为不足4个点的折线列表，points 为全部顶点 (M, 2)，
+              labels 为 [(类别ID, 前4个点的坐标), ...]
+    """
+    closed, classes, opened, points, labels = [], [], [], [], []
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        try:
+            coords = np.array(parts[1:], dtype=np.float64)
+        except ValueError:
+            continue
+        coords = coords[:len(coords) // 2 * 2].reshape(-1, 2)
+        points.append(coords)
+        for i in range(0, len(coords), 4):
+            polygon = coords[i:i + 4]
+            if len(polygon) == 4:
+                closed.append(polygon)
+                classes.append(parts[0])
+            else:
+                opened.append(polygon)
+        if len(coords) >= 4:
+            labels.append((parts[0], coords[:4]))
+
+    return {
+        'closed': np.array(closed, dtype=np.float64).reshape(-1, 4, 2),
+        'classes': np.array(classes, dtype=object),
+        'open': opened,
+        'points': np.concatenate(points) if points else np.empty((0, 2), dtype=np.float64),
+        'labels': labels,
+    }
+
+def quad_iou_matrix(quads1, quads2):
+    """
+    向量化计算两组四边形之间的 IoU（使用各自的外接矩形）
+
+    Args:
+        quads1: (N, 4, 2) 归一化坐标
+        quads2: (M, 4, 2) 归一化坐标
+    Returns:
+        (N, M) 的 IoU 矩阵
+    """
+    boxes1 = np.concatenate([quads1.min(axis=1), quads1.max(axis=1)], axis=1)
+    boxes2 = np.concatenate([quads2.min(axis=1), quads2.max(axis=1)], axis=1)
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2:] - boxes1[:, :2]).prod(axis=1)
+    area2 = (boxes2[:, 2:] - boxes2[:, :2]).prod(axis=1)
+    union = area1[:, None] + area2[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def diff_annotations(annotations1, annotations2, iou_threshold=0.5):
+    """
+    比较同一图像的两份标注
+
+    按 IoU 从高到低贪心匹配两侧的四边形，IoU 低于阈值的不匹配。
+
+    Args:
+        annotations1: 第一个文件夹的 parse_annotations 结果
+        annotations2: 第二个文件夹的 parse_annotations 结果
+        iou_threshold: 视为同一目标的最小 IoU
+    Returns:
+        dict: added(仅第二份有)、removed(仅第一份有)、relabeled(匹配但类别不同)、
+              matched(匹配数)、severity(差异数之和)
+    """
+    quads1, quads2 = annotations1['closed'], annotations2['closed']
+    matched = relabeled = 0
+    if len(quads1) and len(quads2):
+        iou = quad_iou_matrix(quads1, quads2)
+        rows, cols = np.nonzero(iou >= iou_threshold)
+        used1, used2 = set(), set()
+        for k in np.argsort(-iou[rows, cols], kind='stable'):
+            i, j = rows[k], cols[k]
+            if i in used1 or j in used2:
+                continue
+            used1.add(i)
+            used2.add(j)
+            matched += 1
+            if annotations1['classes'][i] != annotations2['classes'][j]:
+                relabeled += 1
+
+    added = len(quads2) - matched
+    removed = len(quads1) - matched
+    return {
+        'added': added,
+        'removed': removed,
+        'relabeled': relabeled,
+        'matched': matched,
+        'severity': added + removed + relabeled,
+    }
+
+def format_diff(diff):
+    """差异的简短描述，用于叠加在画面上"""
+    if diff is None:
+        return "Diff: ..."
+    if diff['severity'] == 0:
+        return "Diff: identical"
+    return f"Diff: +{diff['added']} -{diff['removed']} ~{diff['relabeled']} (matched {diff['matched']})"
+
+class AnnotationDiffScanner:
+    """
+    后台线程逐个比较两个文件夹的标注，只读取标注文件，不解码图像
+
+    计算过程中即可查询已完成部分的结果；全部完成后可按差异严重程度排序。
+    """
+
+    def __init__(self, folder1, folder2, files, iou_threshold=0.5):
+        self.folder1 = folder1
+        self.folder2 = folder2
+        self.files = files
+        self.iou_threshold = iou_threshold
+        self.diffs = [None] * len(files)
+        self.done = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for i, image_file in enumerate(self.files):
+            if self.stopped:
+                return
+            stem = os.path.splitext(image_file)[0] + ".txt"
+            try:
+                annotations1 = parse_annotations(read_annotations(os.path.join(self.folder1, stem)))
+                annotations2 = parse_annotations(read_annotations(os.path.join(self.folder2, stem)))
+                self.diffs[i] = diff_annotations(annotations1, annotations2, self.iou_threshold)
+            except Exception as e:
+                print(f"比较标注 {image_file} 时出错: {str(e)}")
+        self.done = True
+
+    def differing_count(self):
+        return sum(1 for diff in self.diffs if diff is not None and diff['severity'] > 0)
+
+    def next_differing(self, order, position, direction=1):
+        """
+        沿 direction 方向查找下一个存在差异的位置（循环查找）
+
+        Returns:
+            int: 在 order 中的位置，已计算的部分中没有差异时返回None
+        """
+        step = -1 if direction < 0 else 1
+        for offset in range(1, len(order)):
+            candidate = (position + step * offset) % len(order)
+            diff = self.diffs[order[candidate]]
+            if diff is not None and diff['severity'] > 0:
+                return candidate
+        return None
+
+    def severity_order(self):
+        """按差异严重程度从高到低排序的文件序号，严重程度相同时保持原顺序"""
+        return sorted(range(len(self.files)),
+                      key=lambda i: (-(self.diffs[i]['severity'] if self.diffs[i] else 0), i))
+
+    def stop(self):
+        self.stopped = True
 
 def draw_annotations(img, annotations):
-    """在图像上绘制标注"""
+    """
+    在图像上绘制标注，所有四边形通过一次 cv.polylines 批量绘制
+
+    Args:
+        img: 图像
+        annotations: parse_annotations 的结果，或标注行列表
+    Returns:
+        绘制后的图像副本
+    """
+    if not isinstance(annotations, dict):
+        annotations = parse_annotations(annotations)
     img_copy = img.copy()
+    # 与逐点计算 int(坐标 * 尺寸) 的结果一致：float64 相乘后向零取整
+    scale = np.array([img.shape[1], img.shape[0]], dtype=np.float64)
     
-    for line in annotations:
-        parts = line.strip().split()
-        class_id = parts[0]
-        coords = [float(x) for x in parts[1:]]
-        
-        points = [(int(coords[i] * img.shape[1]), int(coords[i+1] * img.shape[0])) 
-                 for i in range(0, len(coords), 2)]
-        
-        for i in range(0, len(points), 4):
-            quadrilateral = points[i:i+4]
-            
-            for j in range(len(quadrilateral) - 1):
-                cv.line(img_copy, quadrilateral[j], quadrilateral[j+1], 
-                       color=(0, 255, 0), thickness=1)
-            
-            if len(quadrilateral) == 4:
-                cv.line(img_copy, quadrilateral[-1], quadrilateral[0], 
-                       color=(0, 255, 0), thickness=1)
-        
-        for point in points:
-            cv.circle(img_copy, point, 3, (255, 0, 0), -1)
-        
-        if len(points) >= 4:
-            center = np.mean(points[:4], axis=0).astype(int)
-            label_position = (center[0] + 10, center[1] - 10)
-            cv.putText(img_copy, class_id, label_position, 
-                      cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv.LINE_AA)
+    if len(annotations['closed']):
+        quads = (annotations['closed'] * scale).astype(np.int32)
+        cv.polylines(img_copy, list(quads), True, (0, 255, 0), 1)
+    if annotations['open']:
+        polylines = [(polygon * scale).astype(np.int32) for polygon in annotations['open']]
+        cv.polylines(img_copy, polylines, False, (0, 255, 0), 1)
+    
+    for x, y in (annotations['points'] * scale).astype(np.int32):
+        cv.circle(img_copy, (int(x), int(y)), 3, (255, 0, 0), -1)
+    
+    for class_id, corners in annotations['labels']:
+        x, y = np.mean((corners * scale).astype(np.int32), axis=0).astype(int)
+        cv.putText(img_copy, class_id, (int(x) + 10, int(y) - 10),
+                  cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv.LINE_AA)
     
     return img_copy
-import cv2 as cv
-import os
-import numpy as np
-from collections import deque
-import argparse
+
+def read_annotations(label_path):
+    """读取标注文件的所有行，文件不存在时返回空列表"""
+    if not os.path.exists(label_path):
+        return []
+    with open(label_path, 'r') as f:
+        return f.readlines()
 
 def load_image_and_annotations(image_path, label_path):
     """加载图像和标注"""
@@ -49,28 +234,481 @@ def load_image_and_annotations(image_path, label_path):
     if img is None:
         return None, None
     
-    annotations = []
-    if os.path.exists(label_path):
-        with open(label_path, 'r') as f:
-            annotations = f.readlines()
+    return img, read_annotations(label_path)
+
+# cv.imread 按 1/2、1/4、1/8 缩小解码的标志（JPEG 在解码阶段直接缩小，速度和内存都明显降低）
+REDUCED_FLAGS = [(8, cv.IMREAD_REDUCED_COLOR_8), (4, cv.IMREAD_REDUCED_COLOR_4),
+                 (2, cv.IMREAD_REDUCED_COLOR_2)]
+
+# JPEG 中携带图像尺寸的 SOF 段标记
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def read_image_size(image_path):
+    """
+    只读取文件头获取图像尺寸（支持 PNG、JPEG、BMP），不解码像素
+
+    Returns:
+        tuple: (宽, 高)，无法识别时返回None
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            head = f.read(26)
+            if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                return struct.unpack('>II', head[16:24])
+            if head.startswith(b'BM'):
+                width, height = struct.unpack('<ii', head[18:26])
+                return width, abs(height)
+            if not head.startswith(b'\xff\xd8'):
+                return None
+            # 逐段跳过 JPEG 标记，直到遇到 SOF 段
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                length = struct.unpack('>H', f.read(2))[0]
+                if marker[1] in JPEG_SOF_MARKERS:
+                    height, width = struct.unpack('>xHH', f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+def decode_for_display(image_path, max_width, max_height):
+    """
+    解码图像并缩放到指定区域内
+
+    缩放比例足够小时使用 IMREAD_REDUCED_* 缩小解码，避免先解码全分辨率图像再缩小。
+    缩小倍数按图像可能的 EXIF 旋转留出余量，保证缩小解码后的图像不小于显示尺寸。
+    """
+    flag = cv.IMREAD_COLOR
+    size = read_image_size(image_path)
+    if size and size[0] > 0 and size[1] > 0:
+        width, height = size
+        scale = max(min(max_width / width, max_height / height),
+                    min(max_width / height, max_height / width))
+        for factor, reduced_flag in REDUCED_FLAGS:
+            if scale * factor <= 1:
+                flag = reduced_flag
+                break
+
+    img = cv.imread(image_path, flag)
+    if img is None:
+        return None
+    scale_factor = min(max_width / img.shape[1], max_height / img.shape[0])
+    return cv.resize(img, (int(img.shape[1] * scale_factor), int(img.shape[0] * scale_factor)))
+
+class ThumbnailCache:
+    """
+    磁盘缩略图缓存
+
+    以 (绝对路径, 修改时间, 显示尺寸) 为键，图像被修改或窗口尺寸变化时自动失效。
+    缩略图按键的哈希值分散存放在两级子目录中，写入时先写临时文件再替换，多线程写入安全。
+    """
+
+    def __init__(self, cache_dir, quality=95):
+        self.cache_dir = cache_dir
+        self.quality = quality
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, image_path, max_width, max_height):
+        stat = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}|{int(max_width)}x{int(max_height)}"
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.jpg')
+
+    def load(self, image_path, max_width, max_height):
+        """读取缩略图，未命中时解码原图并写入缓存"""
+        thumb_path = self._path(image_path, max_width, max_height)
+        img = cv.imread(thumb_path) if os.path.exists(thumb_path) else None
+        if img is not None:
+            return img
+
+        img = decode_for_display(image_path, max_width, max_height)
+        if img is not None:
+            try:
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                ok, data = cv.imencode('.jpg', img, [cv.IMWRITE_JPEG_QUALITY, self.quality])
+                if ok:
+                    temp_path = f"{thumb_path}.{threading.get_ident()}.tmp"
+                    with open(temp_path, 'wb') as f:
+                        f.write(data.tobytes())
+                    os.replace(temp_path, thumb_path)
+            except OSError as e:
+                print(f"写入缩略图缓存失败: {str(e)}")
+        return img
+
+class ImagePrefetcher:
+    """
+    后台解码线程池 + LRU 缓存
+
+    按浏览方向提前解码后续若干张图像，主线程只从缓存中取结果，不会阻塞在 cv.imread 上。
+    缓存容量可以按条目数或占用内存（MB）限制，两者同时给出时任一超限即淘汰最久未使用的条目。
+    """
+
+    def __init__(self, loader, total, workers=4, cache_size=32, cache_mb=None, lookahead=4):
+        """
+        Args:
+            loader: 加载函数，接收索引并返回 (结果, 占用字节数)
+            total: 图像总数
+            workers: 解码线程数
+            cache_size: 缓存最多保留的条目数，为None时不按条目数限制
+            cache_mb: 缓存最多占用的内存（MB），为None时不按内存限制
+            lookahead: 沿浏览方向预取的图像数
+        """
+        self.loader = loader
+        self.total = total
+        self.cache_size = cache_size
+        self.cache_bytes = int(cache_mb * 1024 * 1024) if cache_mb else None
+        self.lookahead = max(0, lookahead)
+        self.cache = OrderedDict()
+        self.used_bytes = 0
+        self.center = None
+        self.order = None
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def _load(self, idx):
+        try:
+            value, size = self.loader(idx)
+        except Exception as e:
+            print(f"加载第 {idx + 1} 张图像时出错: {str(e)}")
+            value, size = None, 0
+        with self.lock:
+            self.pending.pop(idx, None)
+            if idx in self.cache:
+                return
+            self.cache[idx] = (value, size)
+            self.used_bytes += size
+            self._evict()
+
+    def _over_budget(self):
+        return ((self.cache_size and len(self.cache) > self.cache_size) or
+                (self.cache_bytes and self.used_bytes > self.cache_bytes))
+
+    def _evict(self):
+        """按最久未使用的顺序淘汰条目，当前显示的图像始终保留"""
+        for idx in list(self.cache):
+            if not self._over_budget():
+                break
+            if idx == self.center:
+                continue
+            _, size = self.cache.pop(idx)
+            self.used_bytes -= size
+
+    def _submit(self, idx):
+        """调用方需持有锁"""
+        if idx not in self.cache and idx not in self.pending:
+            self.pending[idx] = self.executor.submit(self._load, idx)
+
+    def set_order(self, order):
+        """设置浏览顺序（位置 -> 图像序号），为None时按序号顺序浏览；已缓存的图像仍然有效"""
+        with self.lock:
+            self.order = order
+
+    def request(self, center, direction=1):
+        """
+        请求当前位置的图像并沿浏览方向预取
+
+        当前图像最先提交；离开预取窗口且尚未开始解码的任务会被取消。
+        """
+        direction = -1 if direction < 0 else 1
+        positions = [center]
+        positions += [(center + direction * i) % self.total for i in range(1, self.lookahead + 1)]
+        positions.append((center - direction) % self.total)
+        with self.lock:
+            window = [self.order[pos] for pos in positions] if self.order else positions
+            self.center = window[0]
+            for idx in list(self.pending):
+                if idx not in window and self.pending[idx].cancel():
+                    del self.pending[idx]
+            for idx in window:
+                self._submit(idx)
+
+    def get(self, idx):
+        """
+        非阻塞地读取缓存
+
+        Returns:
+            tuple: (是否已加载, 结果)，加载函数抛出异常时结果为None
+        """
+        with self.lock:
+            if idx not in self.cache:
+                return False, None
+            self.cache.move_to_end(idx)
+            return True, self.cache[idx][0]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def load_resized(folder, image_file, max_width, max_height, thumb_cache=None):
+    """
+    加载单个文件夹中的图像及标注，并缩放到指定区域内
+
+    Args:
+        thumb_cache: ThumbnailCache 对象，为None时不使用磁盘缩略图缓存
+    """
+    image_path = os.path.join(folder, image_file)
+    label_path = os.path.join(folder, os.path.splitext(image_file)[0] + ".txt")
+    if thumb_cache is not None:
+        resized_img = thumb_cache.load(image_path, max_width, max_height)
+    else:
+        resized_img = decode_for_display(image_path, max_width, max_height)
+    if resized_img is None:
+        return None
+    return resized_img, parse_annotations(read_annotations(label_path)), image_file
+
+def compose_frame(entry1, entry2, folder1, folder2, index, total, show_annotations=True,
+                  extra_text=None):
+    """
+    绘制两侧的标注和文字信息，并左右拼接为一帧
+
+    Args:
+        entry1, entry2: load_resized 的返回值
+        folder1, folder2: 两侧的文件夹路径（用于显示）
+        index: 当前图像序号（从0开始）
+        total: 图像总数
+        show_annotations: 是否绘制标注
+        extra_text: 额外显示在两侧的一行文字（如标注差异）
+    """
+    img1, annotations1, image_file = entry1
+    img2, annotations2, image_file = entry2
+    
+    # 绘制两幅图像的标注
+    img_copy1 = draw_annotations(img1, annotations1) if show_annotations else img1.copy()
+    img_copy2 = draw_annotations(img2, annotations2) if show_annotations else img2.copy()
+    
+    # 添加文件信息
+    info_text = f"File: {image_file} ({index + 1}/{total})"
+    for img in [img_copy1, img_copy2]:
+        cv.putText(img, info_text, (10, 30), cv.FONT_HERSHEY_SIMPLEX, 
+                  0.7, (0, 255, 255), 2, cv.LINE_AA)
+    
+    # 添加文件夹路径信息
+    cv.putText(img_copy1, f"Path: {folder1}", (10, 60), cv.FONT_HERSHEY_SIMPLEX, 
+              0.7, (0, 255, 255), 2, cv.LINE_AA)
+    cv.putText(img_copy2, f"Path: {folder2}", (10, 60), cv.FONT_HERSHEY_SIMPLEX, 
+              0.7, (0, 255, 255), 2, cv.LINE_AA)
+    
+    if extra_text:
+        for img in [img_copy1, img_copy2]:
+            cv.putText(img, extra_text, (10, 90), cv.FONT_HERSHEY_SIMPLEX, 
+                      0.7, (0, 0, 255), 2, cv.LINE_AA)
     
-    return img, annotations
+    # 两侧高度不同时在下方补黑边后再合并
+    height = max(img_copy1.shape[0], img_copy2.shape[0])
+    img_copy1, img_copy2 = [cv.copyMakeBorder(img, 0, height - img.shape[0], 0, 0, cv.BORDER_CONSTANT)
+                            if img.shape[0] < height else img for img in (img_copy1, img_copy2)]
+    
+    # 合并图像
+    return np.hstack((img_copy1, img_copy2))
 
-def draw_annotations(img, annotations):
-    """在图像上绘制标注"""
-    # ...existing code...
+def fit_canvas(img, width, height):
+    """将图像等比缩放后居中放到固定尺寸的黑色画布上"""
+    scale = min(width / img.shape[1], height / img.shape[0])
+    new_width = max(1, int(img.shape[1] * scale))
+    new_height = max(1, int(img.shape[0] * scale))
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    x = (width - new_width) // 2
+    y = (height - new_height) // 2
+    canvas[y:y + new_height, x:x + new_width] = cv.resize(img, (new_width, new_height))
+    return canvas
 
-def visualize_annotations(folder1, folder2):
+def find_common_files(folder1, folder2, patterns=None):
     """
-    同时显示两个文件夹中的同名图像及其标注，方便对比。
-    支持方向键切换图片，按 q 退出。
+    获取两个文件夹共有的图片文件名（已排序）
+
+    Args:
+        patterns: 文件名通配符列表，不为空时只保留匹配任一通配符的文件
     """
-    # 获取两个文件夹中的图片文件
-    image_files1 = [f for f in os.listdir(folder1) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-    image_files2 = [f for f in os.listdir(folder2) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
+    image_files1 = [f for f in os.listdir(folder1) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    image_files2 = [f for f in os.listdir(folder2) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    common_files = sorted(set(image_files1) & set(image_files2))
+    if patterns:
+        common_files = [f for f in common_files
+                        if any(fnmatch.fnmatch(f, pattern) for pattern in patterns)]
+    return common_files
+
+# 渲染进程的共享参数，由 _init_render_worker 在每个进程启动时设置
+_render_context = {}
+
+def _init_render_worker(folder1, folder2, total, tile_size, thumb_cache_dir, show_annotations):
+    _render_context.update(
+        folder1=folder1, folder2=folder2, total=total, tile_size=tile_size,
+        thumb_cache=ThumbnailCache(thumb_cache_dir) if thumb_cache_dir else None,
+        show_annotations=show_annotations)
+
+def render_comparison(task):
+    """
+    在渲染进程中生成单个文件的对比图（与交互式查看器使用相同的加载和绘制代码）
+
+    Args:
+        task: (序号, 文件名, 输出路径)，输出路径不为None时直接写出图片
+    Returns:
+        输出路径不为None时返回是否写出成功；否则返回缩放到 tile_size 的画面，读取失败时返回None。
+        单个文件出错只计为失败，不中断整批渲染。
+    """
+    index, image_file, output_path = task
+    ctx = _render_context
+    pane_width = WINDOW_WIDTH / 2
+    try:
+        entry1 = load_resized(ctx['folder1'], image_file, pane_width, WINDOW_HEIGHT, ctx['thumb_cache'])
+        entry2 = load_resized(ctx['folder2'], image_file, pane_width, WINDOW_HEIGHT, ctx['thumb_cache'])
+        if entry1 is None or entry2 is None:
+            return False if output_path else None
+        
+        frame = compose_frame(entry1, entry2, ctx['folder1'], ctx['folder2'],
+                              index, ctx['total'], ctx['show_annotations'])
+        if output_path:
+            return cv.imwrite(output_path, frame)
+        return fit_canvas(frame, *ctx['tile_size'])
+    except Exception as e:
+        print(f"\n渲染 {image_file} 时出错: {str(e)}")
+        return False if output_path else None
+
+def iter_ordered(executor, func, items, window):
+    """按提交顺序返回结果，同时在途的任务数不超过 window，避免结果堆积占满内存"""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def write_contact_sheet(tiles, cols, rows, tile_size, output_path):
+    """将若干画面按行拼成一页缩略图，不足一页时用黑色补齐"""
+    tile_width, tile_height = tile_size
+    blank = np.zeros((tile_height, tile_width, 3), dtype=np.uint8)
+    tiles = tiles + [blank] * (cols * rows - len(tiles))
+    page = np.vstack([np.hstack(tiles[r * cols:(r + 1) * cols]) for r in range(rows)])
+    return cv.imwrite(output_path, page)
+
+def render_batch(folder1, folder2, output, mode='images', patterns=None, processes=None,
+                 sheet_cols=4, sheet_rows=6, tile_width=640, fps=5,
+                 thumb_cache_dir=None, show_annotations=True):
+    """
+    无界面批量渲染对比图，用于在服务器上预先生成供审核的结果
+
+    Args:
+        folder1: 第一个图像文件夹
+        folder2: 第二个图像文件夹
+        output: images/sheet 模式为输出文件夹，video 模式为视频文件路径
+        mode: 'images'(每个文件一张对比图)、'sheet'(缩略图拼版)或 'video'(每个文件一帧)
+        patterns: 文件名通配符列表，只渲染匹配的文件
+        processes: 渲染进程数，默认为CPU核数
+        sheet_cols: 拼版每页的列数
+        sheet_rows: 拼版每页的行数
+        tile_width: 拼版中每个对比图的宽度
+        fps: 视频帧率
+        thumb_cache_dir: 磁盘缩略图缓存目录
+        show_annotations: 是否绘制标注
+    Returns:
+        bool: 是否成功
+    """
+    try:
+        common_files = find_common_files(folder1, folder2, patterns)
+        if not common_files:
+            print("未找到两个文件夹中的共同图片文件。")
+            return False
+        
+        total = len(common_files)
+        processes = processes or os.cpu_count() or 1
+        if mode == 'video':
+            tile_size = (WINDOW_WIDTH, WINDOW_HEIGHT)
+        else:
+            tile_size = (tile_width, max(1, tile_width * WINDOW_HEIGHT // WINDOW_WIDTH))
+        
+        if mode == 'images':
+            os.makedirs(output, exist_ok=True)
+            # 保留原扩展名（a.png -> a.png.jpg），避免 a.jpg 与 a.png 的输出互相覆盖
+            tasks = [(i, f, os.path.join(output, f + '.jpg'))
+                     for i, f in enumerate(common_files)]
+        else:
+            if mode == 'sheet':
+                os.makedirs(output, exist_ok=True)
+            elif os.path.dirname(output):
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+            tasks = [(i, f, None) for i, f in enumerate(common_files)]
+        
+        writer = None
+        if mode == 'video':
+            writer = cv.VideoWriter(output, cv.VideoWriter_fourcc(*'mp4v'), fps, tile_size)
+            if not writer.isOpened():
+                print(f"无法创建视频文件: {output}")
+                return False
+        
+        rendered = 0
+        failed = []
+        tiles = []
+        pages = 0
+        try:
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_render_worker,
+                                     initargs=(folder1, folder2, total, tile_size,
+                                               thumb_cache_dir, show_annotations)) as executor:
+                results = iter_ordered(executor, render_comparison, tasks, processes * 4)
+                for (_, image_file, _), result in tqdm(zip(tasks, results), total=total, desc="渲染进度"):
+                    if result is None or result is False:
+                        failed.append(image_file)
+                        continue
+                    rendered += 1
+                    if mode == 'video':
+                        writer.write(result)
+                    elif mode == 'sheet':
+                        tiles.append(result)
+                        if len(tiles) == sheet_cols * sheet_rows:
+                            pages += 1
+                            write_contact_sheet(tiles, sheet_cols, sheet_rows, tile_size,
+                                                os.path.join(output, f"sheet_{pages:04d}.jpg"))
+                            tiles = []
+            
+            if tiles:
+                pages += 1
+                write_contact_sheet(tiles, sheet_cols, sheet_rows, tile_size,
+                                    os.path.join(output, f"sheet_{pages:04d}.jpg"))
+        finally:
+            # 渲染进程异常退出时也要写完视频文件尾，已写入的帧仍可播放
+            if writer is not None:
+                writer.release()
+        
+        print(f"\n渲染完成!")
+        print(f"共同文件: {total} 个")
+        print(f"成功渲染: {rendered} 个")
+        if mode == 'sheet':
+            print(f"拼版页数: {pages} 页")
+        if failed:
+            print(f"渲染失败: {len(failed)} 个")
+            for image_file in failed[:10]:
+                print(f"  - {image_file}")
+        print(f"输出位置: {os.path.abspath(output)}")
+        return True
     
-    # 获取两个文件夹共有的文件
-    common_files = sorted(list(set(image_files1) & set(image_files2)))
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+        return False
+
+def visualize_annotations(folder1, folder2, cache_size=32, cache_mb=None, workers=4, lookahead=4,
+                          thumb_cache_dir=None, iou_threshold=0.5):
+    """
+    同时显示两个文件夹中的同名图像及其标注，方便对比。
+    支持方向键切换图片，按 n / p 跳到下一个 / 上一个标注有差异的文件，
+    按 s 切换按差异严重程度排序，按 t 切换标注显示，按 q 退出。
+
+    Args:
+        folder1: 第一个图像文件夹
+        folder2: 第二个图像文件夹
+        cache_size: 缓存的图像对数量上限，为None时不按数量限制
+        cache_mb: 缓存占用的内存上限（MB），为None时不按内存限制
+        workers: 后台解码线程数
+        lookahead: 沿浏览方向预取的图像数
+        thumb_cache_dir: 磁盘缩略图缓存目录，为None时不使用
+        iou_threshold: 比较标注差异时视为同一目标的最小 IoU
+    """
+    # 获取两个文件夹共有的图片文件
+    common_files = find_common_files(folder1, folder2)
     
     if not common_files:
         print("未找到两个文件夹中的共同图片文件。")
@@ -81,104 +719,146 @@ def visualize_annotations(folder1, folder2):
     cv.namedWindow(window_title, cv.WINDOW_NORMAL)
     
     # 设置窗口大小（双倍宽度）
-    window_width, window_height = 2560, 720  # 双倍宽度
+    window_width, window_height = WINDOW_WIDTH, WINDOW_HEIGHT
     cv.resizeWindow(window_title, window_width, window_height)
     
-    # 初始化图像缓存
-    cache_size = 3
-    image_cache1 = {}
-    image_cache2 = {}
     current_index = 0
+    direction = 1
     total_images = len(common_files)
+    thumb_cache = ThumbnailCache(thumb_cache_dir) if thumb_cache_dir else None
     
-    def preload_images(center_idx):
-        """预加载两个文件夹中的图像"""
-        indices = [(center_idx + i) % total_images for i in range(-1, 2)]
-        for idx in indices:
-            if idx not in image_cache1:
-                image_file = common_files[idx]
-                # 加载第一个文件夹的图像
-                image_path1 = os.path.join(folder1, image_file)
-                label_path1 = os.path.join(folder1, os.path.splitext(image_file)[0] + ".txt")
-                img1, annot1 = load_image_and_annotations(image_path1, label_path1)
-                if img1 is not None:
-                    scale_factor = min(window_width/2 / img1.shape[1], window_height / img1.shape[0])
-                    resized_img1 = cv.resize(img1, (int(img1.shape[1] * scale_factor), int(img1.shape[0] * scale_factor)))
-                    image_cache1[idx] = (resized_img1, annot1, image_file)
-                
-            if idx not in image_cache2:
-                image_file = common_files[idx]
-                # 加载第二个文件夹的图像
-                image_path2 = os.path.join(folder2, image_file)
-                label_path2 = os.path.join(folder2, os.path.splitext(image_file)[0] + ".txt")
-                img2, annot2 = load_image_and_annotations(image_path2, label_path2)
-                if img2 is not None:
-                    scale_factor = min(window_width/2 / img2.shape[1], window_height / img2.shape[0])
-                    resized_img2 = cv.resize(img2, (int(img2.shape[1] * scale_factor), int(img2.shape[0] * scale_factor)))
-                    image_cache2[idx] = (resized_img2, annot2, image_file)
-        
-        # 清理缓存
-        for cache in [image_cache1, image_cache2]:
-            keys = list(cache.keys())
-            for k in keys:
-                if k not in indices:
-                    del cache[k]
+    def load_pair(idx):
+        """在后台线程中加载两个文件夹的同名图像，返回 (图像对, 占用字节数)"""
+        image_file = common_files[idx]
+        entry1 = load_resized(folder1, image_file, window_width / 2, window_height, thumb_cache)
+        entry2 = load_resized(folder2, image_file, window_width / 2, window_height, thumb_cache)
+        size = sum(entry[0].nbytes for entry in (entry1, entry2) if entry is not None)
+        return (entry1, entry2), size
     
-    # 首次预加载
-    preload_images(current_index)
+    prefetcher = ImagePrefetcher(load_pair, total_images, workers, cache_size, cache_mb, lookahead)
+    prefetcher.request(current_index, direction)
     
+    # 后台比较两侧标注；current_index 为浏览位置，order 将位置映射为文件序号
+    scanner = AnnotationDiffScanner(folder1, folder2, common_files, iou_threshold)
+    order = list(range(total_images))
+    sorted_by_severity = False
+    scan_reported = False
+    
+    # 合成帧按 (文件, 位置, 显示设置, 差异) 缓存，只有这些变化时才重新绘制
+    frames = OrderedDict()
+    show_annotations = True
+    shown_view = None
     while True:
-        if current_index in image_cache1 and current_index in image_cache2:
-            img1, annotations1, image_file = image_cache1[current_index]
-            img2, annotations2, image_file = image_cache2[current_index]
-            
-            # 绘制两幅图像的标注
-            img_copy1 = draw_annotations(img1, annotations1) if annotations1 else img1.copy()
-            img_copy2 = draw_annotations(img2, annotations2) if annotations2 else img2.copy()
-            
-            # 添加文件信息
-            info_text = f"File: {image_file} ({current_index + 1}/{total_images})"
-            for img in [img_copy1, img_copy2]:
-                cv.putText(img, info_text, (10, 30), cv.FONT_HERSHEY_SIMPLEX, 
-                          0.7, (0, 255, 255), 2, cv.LINE_AA)
-            
-            # 添加文件夹路径信息
-            cv.putText(img_copy1, f"Path: {folder1}", (10, 60), cv.FONT_HERSHEY_SIMPLEX, 
-                      0.7, (0, 255, 255), 2, cv.LINE_AA)
-            cv.putText(img_copy2, f"Path: {folder2}", (10, 60), cv.FONT_HERSHEY_SIMPLEX, 
-                      0.7, (0, 255, 255), 2, cv.LINE_AA)
-            
-            # 合并图像
-            combined_img = np.hstack((img_copy1, img_copy2))
-            
-            # 更新窗口标题
-            cv.setWindowTitle(window_title, f"Compare: {image_file}")
+        if scanner.done and not scan_reported:
+            print(f"标注差异计算完成: {scanner.differing_count()}/{total_images} 个文件存在差异")
+            scan_reported = True
+        
+        file_index = order[current_index]
+        diff_text = format_diff(scanner.diffs[file_index])
+        view = (file_index, current_index, show_annotations, diff_text)
+        if shown_view != view:
+            combined_img = frames.get(view)
+            if combined_img is not None:
+                frames.move_to_end(view)
+            else:
+                loaded, pair = prefetcher.get(file_index)
+                # 加载出错时结果为None，单侧图像读取失败时对应位置为None
+                if loaded and (pair is None or pair[0] is None or pair[1] is None):
+                    print(f"无法读取图像: {common_files[file_index]}")
+                    shown_view = view
+                elif loaded:
+                    combined_img = compose_frame(pair[0], pair[1], folder1, folder2,
+                                                 current_index, total_images, show_annotations,
+                                                 diff_text)
+                    frames[view] = combined_img
+                    while len(frames) > FRAME_CACHE_SIZE:
+                        frames.popitem(last=False)
             
-            # 显示合并后的图像
-            cv.imshow(window_title, combined_img)
+            if combined_img is not None:
+                # 更新窗口标题并显示合并后的图像
+                cv.setWindowTitle(window_title, f"Compare: {common_files[file_index]}")
+                cv.imshow(window_title, combined_img)
+                shown_view = view
         
-        # 等待用户输入
-        key = cv.waitKey(1) & 0xFF
+        # 等待用户输入；画面无需更新时降低轮询频率，避免空转占满CPU
+        key = cv.waitKey(50 if shown_view == view else 5) & 0xFF
         
         if key == ord('q'):
             break
         elif key == 81 or key == ord('a'):  # 左方向键或'a'
             current_index = (current_index - 1) % total_images
-            preload_images(current_index)
+            direction = -1
+            prefetcher.request(current_index, direction)
         elif key == 83 or key == ord('d'):  # 右方向键或'd'
             current_index = (current_index + 1) % total_images
-            preload_images(current_index)
+            direction = 1
+            prefetcher.request(current_index, direction)
+        elif key == ord('n') or key == ord('p'):  # 下一个 / 上一个有差异的文件
+            direction = 1 if key == ord('n') else -1
+            target = scanner.next_differing(order, current_index, direction)
+            if target is None:
+                print("暂未找到其他存在差异的文件" + ("" if scanner.done else "（差异仍在计算中）"))
+            else:
+                current_index = target
+                prefetcher.request(current_index, direction)
+        elif key == ord('s'):  # 切换按差异严重程度排序
+            if not scanner.done:
+                print("标注差异仍在计算中，请稍后再试")
+                continue
+            file_index = order[current_index]
+            sorted_by_severity = not sorted_by_severity
+            order = scanner.severity_order() if sorted_by_severity else list(range(total_images))
+            prefetcher.set_order(order if sorted_by_severity else None)
+            current_index = 0 if sorted_by_severity else file_index
+            direction = 1
+            prefetcher.request(current_index, direction)
+            print("按差异严重程度排序" if sorted_by_severity else "按文件名排序")
+        elif key == ord('t'):  # 切换标注显示
+            show_annotations = not show_annotations
         elif key == 255:  # 没有按键
             continue
     
+    scanner.stop()
+    prefetcher.close()
     cv.destroyWindow(window_title)
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="数据集标注对比可视化工具")
     parser.add_argument("--folder1", type=str, required=True, help="第一个图像文件夹路径")
     parser.add_argument("--folder2", type=str, required=True, help="第二个图像文件夹路径")
+    parser.add_argument("--cache-size", type=int, default=32, help="缓存的图像对数量上限（默认32，0表示不限）")
+    parser.add_argument("--cache-mb", type=float, default=None, help="缓存占用的内存上限（MB），默认不限")
+    parser.add_argument("--workers", type=int, default=4, help="后台解码线程数（默认4）")
+    parser.add_argument("--prefetch", type=int, default=4, help="沿浏览方向预取的图像数（默认4）")
+    parser.add_argument("--thumb-cache", type=str, default=None,
+                        help="磁盘缩略图缓存目录，重复浏览同一数据集时无需再解码原图")
+    parser.add_argument("--iou", type=float, default=0.5,
+                        help="比较标注差异时视为同一目标的最小 IoU（默认0.5）")
+    
+    # 无界面批量渲染
+    parser.add_argument("--render", choices=RENDER_MODES, default=None,
+                        help="无界面批量渲染：images(逐张对比图)、sheet(缩略图拼版)、video(视频)")
+    parser.add_argument("--output", "-o", type=str, default=None,
+                        help="渲染输出：images/sheet 为文件夹，video 为视频文件路径（如 compare.mp4）")
+    parser.add_argument("--only", action="append", default=None, metavar="PATTERN",
+                        help="只渲染匹配通配符的文件（如 'cam1_*.jpg'），可重复指定")
+    parser.add_argument("--processes", type=int, default=None, help="渲染进程数（默认为CPU核数）")
+    parser.add_argument("--sheet-cols", type=int, default=4, help="拼版每页列数（默认4）")
+    parser.add_argument("--sheet-rows", type=int, default=6, help="拼版每页行数（默认6）")
+    parser.add_argument("--tile-width", type=int, default=640, help="拼版中每个对比图的宽度（默认640）")
+    parser.add_argument("--fps", type=float, default=5, help="视频帧率（默认5）")
+    parser.add_argument("--no-annotations", action="store_true", help="渲染时不绘制标注")
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_arguments()
-    visualize_annotations(args.folder1, args.folder2)
\ No newline at end of file
+    if args.render:
+        if not args.output:
+            print("错误：批量渲染需要指定 --output")
+            exit(1)
+        success = render_batch(args.folder1, args.folder2, args.output, args.render, args.only,
+                               args.processes, args.sheet_cols, args.sheet_rows, args.tile_width,
+                               args.fps, args.thumb_cache, not args.no_annotations)
+        exit(0 if success else 1)
+    visualize_annotations(args.folder1, args.folder2, args.cache_size or None, args.cache_mb,
+                          args.workers, args.prefetch, args.thumb_cache, args.iou)
@@ -1,7 +1,35 @@
 import os
-import shutil
+import re
+import json
+import sqlite3
+import operator
+from collections import defaultdict
 from tqdm import tqdm
 import argparse
+from materialize import LINK_MODES, materialize_file, run_parallel
+
+COMPARE_OPS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+# 支持的图片格式，同名时按此顺序优先
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp']
+IMAGE_PRIORITY = {ext: i for i, ext in enumerate(IMAGE_EXTENSIONS)}
+
+TOKEN_PATTERN = re.compile(
+    r'\s*(?:'
+    r'(?P<count>count\s*\(\s*(?P<count_label>[^\s(),]+)\s*\)\s*'
+    r'(?P<op>>=|<=|==|!=|>|<)\s*(?P<value>\d+))'
+    r'|(?P<lparen>\()|(?P<rparen>\))|(?P<comma>,)'
+    r'|(?P<keyword>(?i:AND|OR|NOT))(?![^\s(),])'
+    r'|(?P<label>[^\s(),]+))',
+    re.IGNORECASE
+)
 
 def parse_args():
     """解析命令行参数"""
@@ -10,69 +38,407 @@ def parse_args():
                       help='源文件夹路径')
     parser.add_argument('--target', '-t', type=str, required=True,
                       help='目标文件夹路径')
-    parser.add_argument('--labels', '-l', type=str, required=True,
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--labels', '-l', type=str,
                       help='要提取的标签，用逗号分隔(例如: 2,5,8)')
+    group.add_argument('--query', type=str,
+                      help='标签查询表达式，支持 AND/OR/NOT、括号和 count(标签)>=N '
+                           '(例如: "2 AND NOT 5", "count(8)>=3")')
+    group.add_argument('--route', '-r', type=str,
+                      help='多目标路由配置（JSON字符串或JSON文件路径），'
+                           '例如 \'{"vehicles": [2, 5], "people": [0]}\'，'
+                           '每个路由输出到目标文件夹下的同名子目录')
+    parser.add_argument('--images', type=str, default=None,
+                      help='图片所在文件夹（默认与标注文件在同一文件夹）')
+    parser.add_argument('--index', '-i', type=str, default=None,
+                      help='标签倒排索引文件路径，指定后索引会被保存并在之后的运行中增量刷新')
+    parser.add_argument('--no-refresh', action='store_true', default=False,
+                      help='直接使用 --index 指定的已有索引，不检查源文件夹中的变化')
+    parser.add_argument('--link', choices=LINK_MODES, default='copy',
+                      help='文件落地方式: copy(复制)、hard(硬链接)、sym(符号链接)、reflink(写时复制)，'
+                           '不支持时自动回退为复制')
+    parser.add_argument('--workers', '-w', type=int, default=8,
+                      help='并发执行文件操作的线程数（默认: 8）')
     parser.add_argument('--quiet', '-q', action='store_true',default=False,
                       help='安静模式，减少输出信息')
     return parser.parse_args()
 
-def extract_and_copy_files(source_folder, target_folder, labels, quiet=False):
+def parse_label_counts(txt_path):
+    """统计单个txt文件中每个标签（每行第一个字段）的出现次数"""
+    counts = defaultdict(int)
+    with open(txt_path, 'r') as file:
+        for line in file:
+            parts = line.split()
+            if parts:
+                counts[parts[0]] += 1
+    return counts
+
+class LabelIndex:
     """
-    从源文件夹中提取包含指定标签的txt文件及其对应的图片文件到目标文件夹
-    
+    标签 -> 文件 的倒排索引，保存在SQLite中
+
+    files 表记录每个txt文件的大小和修改时间，用于增量刷新；
+    postings 表记录每个标签在每个文件中出现的次数。
+    """
+
+    def __init__(self, source_folder, index_path=None):
+        self.source_folder = source_folder
+        self.conn = sqlite3.connect(index_path or ':memory:')
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "name TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "label TEXT NOT NULL, name TEXT NOT NULL, count INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS postings_label ON postings (label);"
+            "CREATE INDEX IF NOT EXISTS postings_name ON postings (name);"
+        )
+        self._postings_cache = {}
+
+    def refresh(self, quiet=False):
+        """
+        增量刷新索引：只解析新增或修改过的txt文件，并删除已不存在文件的记录
+
+        Returns:
+            tuple: (重新解析的文件数, 删除的文件数, 解析失败的文件列表)
+        """
+        indexed = {name: (size, mtime_ns) for name, size, mtime_ns in
+                   self.conn.execute("SELECT name, size, mtime_ns FROM files")}
+        changed = []
+        seen = set()
+        with os.scandir(self.source_folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.txt') or not entry.is_file():
+                    continue
+                st = entry.stat()
+                seen.add(entry.name)
+                if indexed.get(entry.name) != (st.st_size, st.st_mtime_ns):
+                    changed.append((entry.name, st.st_size, st.st_mtime_ns))
+        removed = [name for name in indexed if name not in seen]
+
+        file_rows = []
+        posting_rows = []
+        failed = []
+        for name, size, mtime_ns in tqdm(changed, desc="更新索引", disable=quiet or not changed):
+            try:
+                counts = parse_label_counts(os.path.join(self.source_folder, name))
+            except Exception as e:
+                failed.append((name, str(e)))
+                continue
+            file_rows.append((name, size, mtime_ns))
+            posting_rows.extend((label, name, count) for label, count in counts.items())
+
+        with self.conn:
+            stale = [(name,) for name in removed] + [(row[0],) for row in changed]
+            self.conn.executemany("DELETE FROM postings WHERE name = ?", stale)
+            self.conn.executemany("DELETE FROM files WHERE name = ?", stale)
+            self.conn.executemany(
+                "INSERT INTO files (name, size, mtime_ns) VALUES (?, ?, ?)", file_rows)
+            self.conn.executemany(
+                "INSERT INTO postings (label, name, count) VALUES (?, ?, ?)", posting_rows)
+        self._postings_cache.clear()
+        return len(file_rows), len(removed), failed
+
+    def all_files(self):
+        """返回索引中的全部文件名"""
+        return {row[0] for row in self.conn.execute("SELECT name FROM files")}
+
+    def postings(self, label):
+        """返回 {文件名: 出现次数}，表示包含该标签的所有文件"""
+        if label not in self._postings_cache:
+            self._postings_cache[label] = dict(self.conn.execute(
+                "SELECT name, count FROM postings WHERE label = ?", (label,)))
+        return self._postings_cache[label]
+
+    def close(self):
+        self.conn.close()
+
+def tokenize_query(query):
+    """将查询表达式拆分为 (类型, 值) 形式的记号列表"""
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = TOKEN_PATTERN.match(query, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"无法解析查询表达式: {query[pos:]}")
+        pos = match.end()
+        if match.group('count'):
+            tokens.append(('count', (match.group('count_label'), match.group('op'),
+                                     int(match.group('value')))))
+        elif match.group('lparen'):
+            tokens.append(('(', None))
+        elif match.group('rparen'):
+            tokens.append((')', None))
+        elif match.group('comma'):
+            tokens.append(('OR', None))
+        elif match.group('keyword'):
+            tokens.append((match.group('keyword').upper(), None))
+        elif match.group('label'):
+            tokens.append(('label', match.group('label')))
+    return tokens
+
+def parse_query(query):
+    """
+    解析标签查询表达式为语法树
+
+    语法（优先级 NOT > AND > OR，逗号等同于 OR）:
+        expr    := and_expr (('OR' | ',') and_expr)*
+        and_expr:= not_expr ('AND' not_expr)*
+        not_expr:= 'NOT' not_expr | atom
+        atom    := '(' expr ')' | 'count(' 标签 ')' 比较符 整数 | 标签
+    """
+    tokens = tokenize_query(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+
+    def take(kind):
+        nonlocal pos
+        if peek() != kind:
+            found = tokens[pos][1] or tokens[pos][0] if pos < len(tokens) else '结尾'
+            raise ValueError(f"查询表达式错误：期望 {kind}，实际为 {found}")
+        token = tokens[pos]
+        pos += 1
+        return token[1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == 'OR':
+            take('OR')
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() == 'AND':
+            take('AND')
+            node = ('and', node, parse_not())
+        return node
+
+    def parse_not():
+        if peek() == 'NOT':
+            take('NOT')
+            return ('not', parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        kind = peek()
+        if kind == '(':
+            take('(')
+            node = parse_or()
+            take(')')
+            return node
+        if kind == 'count':
+            return ('count',) + take('count')
+        return ('label', take('label'))
+
+    if not tokens:
+        raise ValueError("查询表达式为空")
+    tree = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"查询表达式错误：多余的内容 {tokens[pos][1] or tokens[pos][0]}")
+    return tree
+
+def evaluate_query(node, index, universe=None):
+    """在倒排索引上求值查询语法树，返回匹配的文件名集合"""
+    if universe is None:
+        universe = index.all_files()
+    kind = node[0]
+    if kind == 'label':
+        return set(index.postings(node[1]))
+    if kind == 'count':
+        _, label, op, value = node
+        compare = COMPARE_OPS[op]
+        postings = index.postings(label)
+        if compare(0, value):
+            # 不含该标签的文件也满足条件，需要在全集上判断
+            return {name for name in universe if compare(postings.get(name, 0), value)}
+        return {name for name, count in postings.items() if compare(count, value)}
+    if kind == 'not':
+        return universe - evaluate_query(node[1], index, universe)
+    if kind == 'and':
+        left = evaluate_query(node[1], index, universe)
+        return left & evaluate_query(node[2], index, universe) if left else left
+    if kind == 'or':
+        return evaluate_query(node[1], index, universe) | evaluate_query(node[2], index, universe)
+    raise ValueError(f"未知的查询节点: {kind}")
+
+def match_label_counts(node, counts):
+    """判断单个文件的标签计数 {标签: 次数} 是否满足查询语法树"""
+    kind = node[0]
+    if kind == 'label':
+        return counts.get(node[1], 0) > 0
+    if kind == 'count':
+        _, label, op, value = node
+        return COMPARE_OPS[op](counts.get(label, 0), value)
+    if kind == 'not':
+        return not match_label_counts(node[1], counts)
+    if kind == 'and':
+        return match_label_counts(node[1], counts) and match_label_counts(node[2], counts)
+    if kind == 'or':
+        return match_label_counts(node[1], counts) or match_label_counts(node[2], counts)
+    raise ValueError(f"未知的查询节点: {kind}")
+
+def labels_to_query(labels):
+    """将标签列表转换为等价的 OR 查询表达式"""
+    return ' OR '.join(labels)
+
+def build_image_map(image_folder):
+    """
+    单次扫描图片目录，建立 文件名主干 -> 图片路径 的映射
+
+    同一主干存在多种格式时，按 IMAGE_EXTENSIONS 中的顺序优先选择。
+    """
+    image_map = {}
+    priorities = {}
+    with os.scandir(image_folder) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            priority = IMAGE_PRIORITY.get(ext.lower())
+            if priority is None or not entry.is_file():
+                continue
+            if stem not in priorities or priority < priorities[stem]:
+                priorities[stem] = priority
+                image_map[stem] = entry.path
+    return image_map
+
+def report_names(message, names, limit=10):
+    """批量汇报文件名列表，只列出前 limit 个"""
+    if not names:
+        return
+    print(message)
+    for name in names[:limit]:
+        print(f"  {name}")
+    if len(names) > limit:
+        print(f"  ... 以及另外 {len(names) - limit} 个")
+
+def parse_route_spec(spec, target_folder):
+    """
+    解析多目标路由配置
+
+    Args:
+        spec: JSON字符串或JSON文件路径，格式如 {"vehicles": [2, 5], "people": [0]}，
+              值也可以是查询表达式字符串，如 {"crowd": "count(0)>=10"}
+        target_folder: 目标根目录，每个路由输出到其下的同名子目录
+    Returns:
+        dict: 目标文件夹路径 -> 查询表达式
+    """
+    if os.path.isfile(spec):
+        with open(spec, 'r', encoding='utf-8') as f:
+            spec = f.read()
+    try:
+        route_map = json.loads(spec)
+    except ValueError as e:
+        raise ValueError("路由配置格式错误，应为JSON对象，例如 '{\"vehicles\": [2, 5]}'") from e
+    if not isinstance(route_map, dict) or not route_map:
+        raise ValueError("路由配置必须是非空的JSON对象")
+
+    routes = {}
+    for name, value in route_map.items():
+        if isinstance(value, str):
+            query = value
+        elif isinstance(value, list) and value:
+            query = labels_to_query([str(label) for label in value])
+        else:
+            raise ValueError(f"路由 {name} 的标签配置无效: {value}")
+        routes[os.path.join(target_folder, name)] = query
+    return routes
+
+def route_files(source_folder, routes, quiet=False, index_path=None, refresh=True,
+                link='copy', workers=8, image_folder=None):
+    """
+    单次扫描源文件夹，将匹配的标注/图片文件对分发到所有满足条件的目标文件夹
+
     Args:
         source_folder: 源文件夹路径
-        target_folder: 目标文件夹路径
-        labels: 要提取的标签列表
+        routes: 目标文件夹路径 -> 查询表达式 的字典
         quiet: 是否启用安静模式
+        index_path: 倒排索引文件路径，为None时仅在内存中建立索引
+        refresh: 是否在查询前增量刷新索引
+        link: 文件落地方式（copy/hard/sym/reflink），不可用时自动回退为复制
+        workers: 并发执行文件操作的线程数
+        image_folder: 图片所在文件夹，为None时与标注文件在同一文件夹
     """
     try:
-        os.makedirs(target_folder, exist_ok=True)
-        txt_files = [f for f in os.listdir(source_folder) if f.endswith('.txt')]
+        trees = {target: parse_query(query) for target, query in routes.items()}
+        for target in trees:
+            os.makedirs(target, exist_ok=True)
         
         processed_count = 0
         skipped_count = 0
+
+        # 每个标注文件只读取一次（刷新索引），之后所有路由都在索引上求值
+        index = LabelIndex(source_folder, index_path)
+        try:
+            if refresh:
+                updated, removed, failed = index.refresh(quiet)
+                skipped_count += len(failed)
+                if not quiet:
+                    print(f"索引更新: 重新解析 {updated} 个文件，移除 {removed} 个文件")
+                    for name, error in failed:
+                        print(f"处理文件 {name} 时出错: {error}")
+            universe = index.all_files()
+            file_targets = defaultdict(list)
+            for target, tree in trees.items():
+                matched = evaluate_query(tree, index, universe)
+                if not quiet and len(trees) > 1:
+                    print(f"{target}: 匹配到 {len(matched)} 个标注文件")
+                for name in matched:
+                    file_targets[name].append(target)
+        finally:
+            index.close()
         
         if not quiet:
+            print(f"匹配到 {len(file_targets)} 个标注文件")
             print(f"开始处理文件...")
         
-        for filename in tqdm(txt_files, desc="处理进度", disable=quiet):
+        # 一次列出图片目录，配对只需查字典；再把落地操作交给线程池并发执行
+        image_map = build_image_map(image_folder or source_folder)
+        jobs = []
+        unmatched = []
+        for filename in sorted(file_targets):
+            base_name = os.path.splitext(filename)[0]
+            image_path = image_map.get(base_name)
+            if image_path is None:
+                unmatched.append(filename)
+                continue
             txt_path = os.path.join(source_folder, filename)
-            
-            try:
-                with open(txt_path, 'r') as file:
-                    lines = file.readlines()
-                    has_target_label = any(line.strip().split()[0] in labels for line in lines)
-                    
-                    if has_target_label:
-                        base_name = os.path.splitext(filename)[0]
-                        image_found = False
-                        
-                        for ext in ['.jpg', '.png']:
-                            image_filename = base_name + ext
-                            image_path = os.path.join(source_folder, image_filename)
-                            
-                            if os.path.exists(image_path):
-                                shutil.copy2(txt_path, os.path.join(target_folder, filename))
-                                shutil.copy2(image_path, os.path.join(target_folder, image_filename))
-                                processed_count += 1
-                                image_found = True
-                                break
-                        
-                        if not image_found and not quiet:
-                            print(f"警告: 未找到对应的图片文件 {base_name}（.jpg 或 .png）")
-                            skipped_count += 1
-                            
-            except Exception as e:
+            image_filename = os.path.basename(image_path)
+            for target in file_targets[filename]:
+                jobs.append((txt_path, image_path, target, filename, image_filename))
+
+        skipped_count += len(unmatched)
+        label_stems = {os.path.splitext(name)[0] for name in universe}
+        orphaned = sorted(image_map[stem] for stem in image_map if stem not in label_stems)
+        if not quiet:
+            report_names(f"警告: {len(unmatched)} 个匹配的标注文件未找到对应的图片文件", unmatched)
+            report_names(f"提示: {len(orphaned)} 个图片文件没有对应的标注文件",
+                         [os.path.basename(path) for path in orphaned])
+
+        def materialize_pair(job):
+            txt_path, image_path, target, filename, image_filename = job
+            materialize_file(txt_path, os.path.join(target, filename), link)
+            return materialize_file(image_path, os.path.join(target, image_filename), link)
+
+        fallback_count = 0
+        for job, used, error in run_parallel(materialize_pair, jobs, workers,
+                                             desc="处理进度", disable=quiet):
+            if error is not None:
                 if not quiet:
-                    print(f"处理文件 {filename} 时出错: {str(e)}")
+                    print(f"处理文件 {job[3]} 时出错: {str(error)}")
                 skipped_count += 1
                 continue
+            processed_count += 1
+            if used != link:
+                fallback_count += 1
         
         if not quiet:
             print(f"\n处理完成!")
             print(f"成功处理: {processed_count} 对文件")
             print(f"跳过/失败: {skipped_count} 个文件")
+            if fallback_count:
+                print(f"无法使用 {link} 方式、已回退为复制: {fallback_count} 对文件")
         
     except Exception as e:
         print(f"发生错误: {str(e)}")
@@ -80,15 +446,58 @@ def extract_and_copy_files(source_folder, target_folder, labels, quiet=False):
     
     return True
 
+def extract_and_copy_files(source_folder, target_folder, labels=None, quiet=False,
+                           query=None, index_path=None, refresh=True, link='copy', workers=8,
+                           image_folder=None):
+    """
+    从源文件夹中提取包含指定标签的txt文件及其对应的图片文件到目标文件夹
+    
+    Args:
+        source_folder: 源文件夹路径
+        target_folder: 目标文件夹路径
+        labels: 要提取的标签列表（包含任一标签即匹配）
+        quiet: 是否启用安静模式
+        query: 标签查询表达式，指定后代替 labels
+        index_path: 倒排索引文件路径，为None时仅在内存中建立索引
+        refresh: 是否在查询前增量刷新索引
+        link: 文件落地方式（copy/hard/sym/reflink），不可用时自动回退为复制
+        workers: 并发执行文件操作的线程数
+        image_folder: 图片所在文件夹，为None时与标注文件在同一文件夹
+    """
+    if query is None:
+        query = labels_to_query(labels)
+    return route_files(source_folder, {target_folder: query}, quiet, index_path, refresh,
+                       link, workers, image_folder)
+
 def main():
     args = parse_args()
-    labels = [label.strip() for label in args.labels.split(',')]
+    labels = [label.strip() for label in args.labels.split(',')] if args.labels else None
     
     if not os.path.exists(args.source):
         print("错误：源文件夹不存在！")
         return 1
+
+    # 没有已保存的索引时跳过刷新只会得到空索引，静默提取 0 个文件
+    if args.no_refresh and not (args.index and os.path.exists(args.index)):
+        print("错误：--no-refresh 需要配合 --index 指定一个已存在的索引文件！")
+        return 1
         
-    success = extract_and_copy_files(args.source, args.target, labels, args.quiet)
+    if args.route:
+        try:
+            routes = parse_route_spec(args.route, args.target)
+        except ValueError as e:
+            print(f"错误：{str(e)}")
+            return 1
+        success = route_files(args.source, routes, args.quiet,
+                              index_path=args.index, refresh=not args.no_refresh,
+                              link=args.link, workers=args.workers,
+                              image_folder=args.images)
+    else:
+        success = extract_and_copy_files(args.source, args.target, labels, args.quiet,
+                                         query=args.query, index_path=args.index,
+                                         refresh=not args.no_refresh,
+                                         link=args.link, workers=args.workers,
+                                         image_folder=args.images)
     return 0 if success else 1
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+import os
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，reflink 将直接回退为复制
+    fcntl = None
+
+# 文件落地方式：copy(复制)、hard(硬链接)、sym(符号链接)、reflink(写时复制克隆)
+LINK_MODES = ['copy', 'hard', 'sym', 'reflink']
+
+# Linux ioctl FICLONE，用于在 btrfs/xfs 等文件系统上创建 reflink
+FICLONE = 0x40049409
+
+def _remove_existing(dst):
+    """链接前删除已存在的目标文件（copy2 会直接覆盖，链接不会）"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+def _reflink(src, dst):
+    """使用 FICLONE 克隆文件内容，文件系统不支持时抛出 OSError"""
+    if fcntl is None:
+        raise OSError("当前平台不支持 reflink")
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+    shutil.copystat(src, dst)
+
+def materialize_file(src, dst, link='copy'):
+    """
+    按指定方式将 src 落地到 dst，请求的方式不可用时自动回退为复制
+
+    Args:
+        src: 源文件路径
+        dst: 目标文件路径
+        link: 'copy'、'hard'、'sym' 或 'reflink'
+    Returns:
+        str: 实际使用的方式
+    """
+    if link != 'copy':
+        try:
+            if os.path.exists(dst) and os.path.samefile(src, dst):
+                return link
+            _remove_existing(dst)
+            if link == 'hard':
+                os.link(src, dst)
+            elif link == 'sym':
+                os.symlink(os.path.abspath(src), dst)
+            elif link == 'reflink':
+                _reflink(src, dst)
+            else:
+                raise ValueError(f"未知的文件落地方式: {link}")
+            return link
+        except OSError:
+            pass  # 跨设备、权限不足或文件系统不支持，回退为复制
+
+    shutil.copy2(src, dst)
+    return 'copy'
+
+def file_digest(path, chunk_size=1 << 20):
+    """分块计算文件内容的哈希值"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+def files_identical(path1, path2):
+    """先比较大小，大小一致时再比较内容哈希"""
+    try:
+        if os.path.getsize(path1) != os.path.getsize(path2):
+            return False
+    except OSError:
+        return False
+    return file_digest(path1) == file_digest(path2)
+
+def is_up_to_date(src, dst, checksum=False):
+    """
+    判断目标文件是否已与源文件一致（用于增量同步）
+
+    默认比较大小和修改时间（误差小于1秒，与 rsync 的默认行为相同）；
+    checksum 为True时改为比较大小和内容哈希。
+    """
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if checksum:
+        return file_digest(src) == file_digest(dst)
+    return abs(src_stat.st_mtime - dst_stat.st_mtime) < 1
+
+def run_parallel(func, items, workers=8, desc="处理进度", disable=False):
+    """
+    使用有界线程池并发执行文件操作
+
+    同时在途的任务数不超过 workers 的 4 倍，避免一次性为数百万文件创建 future。
+
+    Args:
+        func: 对单个元素执行的函数
+        items: 待处理元素的可迭代对象
+        workers: 线程数，1 表示在当前线程顺序执行
+        desc: 进度条描述
+        disable: 是否隐藏进度条
+    Yields:
+        tuple: (元素, 返回值, 异常)，异常为 None 表示成功
+    """
+    total = len(items) if hasattr(items, '__len__') else None
+    with tqdm(total=total, desc=desc, disable=disable) as pbar:
+        if workers <= 1:
+            for item in items:
+                try:
+                    yield item, func(item), None
+                except Exception as e:
+                    yield item, None, e
+                pbar.update(1)
+            return
+
+        max_pending = workers * 4
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            iterator = iter(items)
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(func, item)] = item
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    yield item, None if error else future.result(), error
+                    pbar.update(1)
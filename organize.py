@@ -1,7 +1,13 @@
 import os
+import json
 import shutil
+import hashlib
+import tarfile
 from pathlib import Path
+from collections import defaultdict
 import argparse
+from tqdm import tqdm
+from materialize import LINK_MODES, is_up_to_date, materialize_file, run_parallel
 
 DATASET_STRUCTURES = {
     'split': {
@@ -15,31 +21,118 @@ DATASET_STRUCTURES = {
     'flat': {
         'description': '扁平结构，所有文件在同一目录下',
         'dirs': ['.']
+    },
+    'shards': {
+        'description': '按训练/验证集打包的定长tar分片 (train/shard-000000.tar, val/...)，附带索引文件',
+        'dirs': ['train', 'val']
     }
 }
 
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp']
+
 def create_target_structure(target_dir, structure_type):
     """创建目标目录结构"""
     target_path = Path(target_dir)
     for dir_path in DATASET_STRUCTURES[structure_type]['dirs']:
         (target_path / dir_path).mkdir(parents=True, exist_ok=True)
 
-def organize_dataset(source_dir, target_dir, mode='copy', structure_type='simple'):
+class SplitAssigner:
     """
-    整理数据集文件
-    
-    Args:
-        source_dir (str): 源数据集目录
-        target_dir (str): 目标目录
-        mode (str): 'copy' 或 'move'，决定是复制还是移动文件
-        structure_type (str): 目标数据集结构类型
+    按文件名主干确定性地生成训练/验证集分割
+
+    默认对 "种子:主干" 取哈希，哈希值落在 [0, val_ratio) 的样本划入验证集，
+    不需要读取任何文件，数据集增长时已有样本的归属保持不变。
+
+    stratify 为True时，先流式读取一遍标注文件，以每个文件中出现最多的类别为分层，
+    在每个分层内按哈希顺序等间隔抽取验证样本，使各类别的验证集比例与 val_ratio 一致；
+    内存中只保留每个分层的计数和验证集样本的主干。
+    """
+
+    def __init__(self, val_ratio=0.1, seed=0, stratify=False):
+        self.val_ratio = val_ratio
+        self.seed = seed
+        self.stratify = stratify
+        self.val_stems = set()
+        self.strata = {}
+
+    def _hash(self, text):
+        """将文本映射为 [0, 1) 区间内的确定性数值"""
+        digest = hashlib.blake2b(f"{self.seed}:{text}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') / 2 ** 64
+
+    def prepare(self, source_dir):
+        """分层模式下流式扫描标注文件，确定验证集样本"""
+        if not self.stratify:
+            return
+        for root, dirs, files in os.walk(source_dir):
+            dirs.sort()
+            stems = sorted((Path(file).stem for file in files if file.endswith('.txt')), key=self._hash)
+            for stem in stems:
+                stratum = self._primary_class(Path(root) / f"{stem}.txt")
+                total, val = self.strata.get(stratum, (0, 0))
+                total += 1
+                # 分层内等间隔抽样，起始相位由种子和分层决定
+                if int(total * self.val_ratio + self._hash(f"stratum:{stratum}")) > val:
+                    self.val_stems.add(stem)
+                    val += 1
+                self.strata[stratum] = (total, val)
+
+    @staticmethod
+    def _primary_class(label_path):
+        """文件中出现次数最多的类别（次数相同时取较小者），无标注时为空字符串"""
+        counts = defaultdict(int)
+        try:
+            with open(label_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if parts:
+                        counts[parts[0]] += 1
+        except (OSError, UnicodeDecodeError):
+            return ''
+        if not counts:
+            return ''
+        return min(counts.items(), key=lambda item: (-item[1], item[0]))[0]
+
+    def split_of(self, file_path):
+        stem = Path(file_path).stem
+        if self.stratify:
+            return 'val' if stem in self.val_stems else 'train'
+        return 'val' if self._hash(stem) < self.val_ratio else 'train'
+
+    def print_summary(self, limit=20):
+        if not self.stratify:
+            print(f"按文件名哈希生成分割：验证集比例 {self.val_ratio}，种子 {self.seed}")
+            return
+        print(f"按类别分层生成分割：验证集比例 {self.val_ratio}，种子 {self.seed}")
+        for stratum, (total, val) in sorted(self.strata.items(), key=lambda x: -x[1][0])[:limit]:
+            print(f"- 类别 {stratum or '(无标注)'}: {total} 个文件，验证集 {val} 个")
+        if len(self.strata) > limit:
+            print(f"- ... 以及另外 {len(self.strata) - limit} 个类别")
+
+def get_split(file_path, source_dir, assigner=None):
+    """
+    判断文件所属数据集分割
+
+    指定 assigner 时由其生成分割；否则根据源路径中的 train/val 目录判断，默认为训练集
+    """
+    if assigner is not None:
+        return assigner.split_of(file_path)
+    parts = Path(os.path.relpath(file_path, source_dir)).parts
+    if 'train' in parts or 'val' in parts:
+        return 'train' if 'train' in parts else 'val'
+    return 'train'
+
+def plan_dataset(source_dir, target_dir, structure_type='simple', assigner=None):
+    """
+    规划阶段：确定每个源文件的目标位置，不执行任何文件操作
+
+    多个源文件映射到同一目标路径时视为冲突，只保留第一个。
+
+    Returns:
+        tuple: (计划列表 [(源路径, 目标路径), ...], 冲突列表 [(源路径, 目标路径), ...])
     """
-    source_path = Path(source_dir)
     target_path = Path(target_dir)
-    
-    # 创建目标结构
-    create_target_structure(target_dir, structure_type)
-    
+
     # 分析源目录结构
     print("\n分析源目录结构...")
     has_split = any(d in ['train', 'val'] for d in os.listdir(source_dir) if Path(source_dir, d).is_dir())
@@ -51,41 +144,380 @@ def organize_dataset(source_dir, target_dir, mode='copy', structure_type='simple
     
     def get_target_subdir(file_path):
         """确定文件的目标子目录"""
-        rel_path = os.path.relpath(file_path, source_dir)
-        parts = Path(rel_path).parts
-        
         if structure_type == 'flat':
             return ''
         
         # 根据文件扩展名判断是图像还是标签
-        is_image = Path(file_path).suffix.lower() in ['.jpg', '.jpeg', '.png', '.bmp']
+        is_image = Path(file_path).suffix.lower() in IMAGE_EXTENSIONS
         base_dir = 'images' if is_image else 'labels'
         
         if structure_type == 'split':
-            # 判断是否属于训练或验证集
-            if 'train' in parts or 'val' in parts:
-                split_type = 'train' if 'train' in parts else 'val'
-                return f"{base_dir}/{split_type}"
-            return f"{base_dir}/train"  # 默认放入训练集
+            # 判断是否属于训练或验证集，默认放入训练集
+            return f"{base_dir}/{get_split(file_path, source_dir, assigner)}"
         
         return base_dir
 
-    # 处理文件
+    plan = []
+    collisions = []
+    planned_targets = set()
     for root, _, files in os.walk(source_dir):
         for file in files:
             source_file = Path(root) / file
             target_subdir = get_target_subdir(source_file)
             target_file = target_path / target_subdir / file
-            
+            if target_file in planned_targets:
+                collisions.append((source_file, target_file))
+                continue
+            planned_targets.add(target_file)
+            plan.append((source_file, target_file))
+    return plan, collisions
+
+def write_journal(journal_path, header, plan):
+    """将完整的 源 -> 目标 计划写入日志文件（JSON Lines，首行为任务信息）"""
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for source_file, target_file in plan:
+            f.write(json.dumps([str(source_file), str(target_file)], ensure_ascii=False) + '\n')
+    # 新计划从头执行，清除旧的进度记录
+    progress_path = journal_path + '.progress'
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+
+def load_journal(journal_path):
+    """
+    读取计划日志及执行进度
+
+    Returns:
+        tuple: (任务信息, 计划列表, 已完成的条目序号集合)
+    """
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        plan = [tuple(Path(p) for p in json.loads(line)) for line in f if line.strip()]
+    done = set()
+    progress_path = journal_path + '.progress'
+    if os.path.exists(progress_path):
+        with open(progress_path, 'r', encoding='utf-8') as f:
+            # 最后一行可能因中断而不完整，忽略无法解析的行
+            for line in f:
+                if line.strip().isdigit():
+                    done.add(int(line))
+    return header, plan, done
+
+def execute_plan(plan, source_dir, target_dir, mode='copy', link='copy', workers=8,
+                 journal_path=None, done=None, checkpoint_every=1000, sync=False, checksum=False):
+    """
+    执行阶段：按计划复制/移动文件，并定期把已完成的条目序号写入进度文件
+
+    Args:
+        plan: plan_dataset 或 load_journal 返回的计划列表
+        source_dir (str): 源数据集目录
+        target_dir (str): 目标目录
+        mode (str): 'copy' 或 'move'
+        link (str): 复制模式下的文件落地方式
+        workers (int): 并发执行文件操作的线程数
+        journal_path (str): 计划日志路径，为None时不记录进度
+        done (set): 已完成的条目序号，这些条目会被跳过
+        checkpoint_every (int): 每完成多少个文件刷新一次进度文件
+        sync (bool): 增量同步，目标文件已一致时跳过
+        checksum (bool): 增量同步时比较内容哈希而不是修改时间
+    """
+    done = done or set()
+    pending = [i for i in range(len(plan)) if i not in done]
+    if done:
+        print(f"从上次中断处继续：已完成 {len(done)} 个，剩余 {len(pending)} 个")
+
+    # 目标目录统一创建一次
+    for parent in {plan[i][1].parent for i in pending}:
+        parent.mkdir(parents=True, exist_ok=True)
+
+    # 移动模式下源与目标位于同一设备时直接 os.rename，避免 shutil.move 回退为复制
+    same_device = mode == 'move' and os.stat(source_dir).st_dev == os.stat(target_dir).st_dev
+
+    def transfer(index):
+        """复制（或链接）/移动单个文件"""
+        source_file, target_file = plan[index]
+        if mode == 'copy':
+            if sync and is_up_to_date(source_file, target_file, checksum):
+                return 'unchanged'
+            return materialize_file(source_file, target_file, link)
+        if not source_file.exists() and target_file.exists():
+            return 'done'  # 上次已移动但未记录进度
+        if same_device:
             try:
-                target_file.parent.mkdir(parents=True, exist_ok=True)
-                if mode == 'copy':
-                    shutil.copy2(source_file, target_file)
-                else:
-                    shutil.move(str(source_file), str(target_file))
-                print(f"{'复制' if mode == 'copy' else '移动'} {source_file} -> {target_file}")
-            except Exception as e:
-                print(f"处理文件 {source_file} 时出错: {str(e)}")
+                os.rename(source_file, target_file)
+                return 'rename'
+            except OSError:
+                pass  # 例如挂载点不同或目标已存在于其他文件系统，回退为 shutil.move
+        shutil.move(str(source_file), str(target_file))
+        return 'move'
+
+    # 处理文件
+    action_counts = defaultdict(int)
+    failed_count = 0
+    progress = open(journal_path + '.progress', 'a', encoding='utf-8') if journal_path else None
+    try:
+        for index, used, error in run_parallel(transfer, pending, workers, desc="处理文件"):
+            if error is not None:
+                tqdm.write(f"处理文件 {plan[index][0]} 时出错: {str(error)}")
+                failed_count += 1
+                continue
+            action_counts[used] += 1
+            if progress is not None:
+                progress.write(f"{index}\n")
+                if sum(action_counts.values()) % checkpoint_every == 0:
+                    progress.flush()
+    finally:
+        if progress is not None:
+            progress.close()
+
+    action_names = {'copy': '复制', 'hard': '硬链接', 'sym': '符号链接', 'reflink': '克隆',
+                    'rename': '重命名(同设备移动)', 'move': '移动', 'done': '此前已完成',
+                    'unchanged': '未变化(跳过)'}
+    print(f"\n共处理 {len(pending)} 个文件")
+    for used, count in action_counts.items():
+        print(f"- {action_names[used]}: {count} 个")
+    print(f"- 失败: {failed_count} 个")
+
+def delete_stale_files(target_dir, plan, keep=(), keep_dirs=()):
+    """
+    删除目标目录中不在计划内的文件（rsync --delete 的行为），并清理空目录
+
+    Returns:
+        int: 删除的文件数
+    """
+    planned = {os.path.normpath(target_file) for _, target_file in plan}
+    planned.update(os.path.normpath(path) for path in keep)
+    stale = []
+    for root, _, files in os.walk(target_dir):
+        for file in files:
+            path = os.path.normpath(os.path.join(root, file))
+            if path not in planned:
+                stale.append(path)
+
+    deleted = 0
+    for path, _, error in run_parallel(os.remove, stale, desc="删除过期文件", disable=not stale):
+        if error is not None:
+            tqdm.write(f"删除文件 {path} 时出错: {str(error)}")
+            continue
+        deleted += 1
+
+    # 自底向上删除因此变空的目录（保留目标结构本身）
+    kept_dirs = {os.path.normpath(target_dir)}
+    kept_dirs.update(os.path.normpath(os.path.join(target_dir, d)) for d in keep_dirs)
+    for root, dirs, files in os.walk(target_dir, topdown=False):
+        if os.path.normpath(root) not in kept_dirs and not os.listdir(root):
+            os.rmdir(root)
+    return deleted
+
+def plan_shards(source_dir, shard_size, shard_samples=None, assigner=None):
+    """
+    将图像/标签按文件名主干配对为样本，并按分割依次装入分片
+
+    Args:
+        source_dir (str): 源数据集目录
+        shard_size (int): 每个分片的最大字节数
+        shard_samples (int): 每个分片的最大样本数，为None时不限制
+        assigner (SplitAssigner): 分割生成器，为None时沿用源目录中的 train/val
+    Returns:
+        tuple: (分片列表 [(分割, 分片序号, [(样本键, {扩展名: 路径}), ...]), ...], 重复的文件列表)
+    """
+    samples = {'train': {}, 'val': {}}
+    duplicates = []
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            source_file = Path(root) / file
+            split = get_split(source_file, source_dir, assigner)
+            key = source_file.stem
+            ext = source_file.suffix.lower().lstrip('.')
+            members = samples[split].setdefault(key, {})
+            if ext in members:
+                duplicates.append(source_file)
+                continue
+            members[ext] = source_file
+
+    shards = []
+    for split, split_samples in samples.items():
+        number = 0
+        current, current_bytes = [], 0
+        for key in sorted(split_samples):
+            members = split_samples[key]
+            size = sum(os.path.getsize(path) for path in members.values())
+            if current and (current_bytes + size > shard_size or
+                            (shard_samples and len(current) >= shard_samples)):
+                shards.append((split, number, current))
+                number += 1
+                current, current_bytes = [], 0
+            current.append((key, members))
+            current_bytes += size
+        if current:
+            shards.append((split, number, current))
+    return shards, duplicates
+
+def write_shard(target_dir, shard):
+    """
+    将一个分片的样本写入 tar 文件（WebDataset 格式：同一样本的成员连续存放，
+    成员名为 <样本键>.<扩展名>），先写临时文件再原子替换
+
+    Returns:
+        dict: 分片索引信息，包含每个成员在 tar 中的数据偏移和大小
+    """
+    split, number, samples = shard
+    rel_path = f"{split}/shard-{number:06d}.tar"
+    shard_path = os.path.join(target_dir, rel_path)
+    tmp_path = shard_path + '.tmp'
+    entries = []
+    with tarfile.open(tmp_path, 'w') as tar:
+        for key, members in samples:
+            entry = {'key': key, 'members': {}}
+            for ext in sorted(members):
+                info = tar.gettarinfo(str(members[ext]), arcname=f"{key}.{ext}")
+                with open(members[ext], 'rb') as f:
+                    tar.addfile(info, f)
+                # 写入后 tar.offset 位于按512字节对齐的数据块末尾，由此反推数据起始偏移
+                data_offset = tar.offset - -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                entry['members'][ext] = [data_offset, info.size]
+            entries.append(entry)
+    os.replace(tmp_path, shard_path)
+    return {'path': rel_path, 'split': split, 'samples': len(samples),
+            'bytes': os.path.getsize(shard_path), 'entries': entries}
+
+def pack_shards(source_dir, target_dir, mode='copy', shard_size=1 << 30,
+                shard_samples=None, workers=8, assigner=None):
+    """
+    将数据集打包为定长 tar 分片，并写出索引文件
+
+    索引包括 shards.json（每个分片的路径、分割、样本数和大小）和 index.jsonl
+    （每个样本所在分片及其成员在 tar 中的偏移），下游可据此顺序读取或随机访问。
+
+    Args:
+        source_dir (str): 源数据集目录
+        target_dir (str): 目标目录
+        mode (str): 'copy' 保留源文件，'move' 在分片写入成功后删除源文件
+        shard_size (int): 每个分片的最大字节数
+        shard_samples (int): 每个分片的最大样本数
+        workers (int): 并行打包的线程数
+        assigner (SplitAssigner): 分割生成器，为None时沿用源目录中的 train/val
+    """
+    print("\n规划分片...")
+    shards, duplicates = plan_shards(source_dir, shard_size, shard_samples, assigner)
+    if duplicates:
+        print(f"警告: {len(duplicates)} 个文件与同分割中已有样本的同名成员重复，已跳过:")
+        for path in duplicates[:10]:
+            print(f"  {path}")
+        if len(duplicates) > 10:
+            print(f"  ... 以及另外 {len(duplicates) - 10} 个")
+    print(f"共 {sum(len(s[2]) for s in shards)} 个样本，{len(shards)} 个分片")
+
+    shard_infos = []
+    failed_count = 0
+    for shard, info, error in run_parallel(lambda shard: write_shard(target_dir, shard),
+                                           shards, workers, desc="打包分片"):
+        if error is not None:
+            tqdm.write(f"写入分片 {shard[0]}/shard-{shard[1]:06d}.tar 时出错: {str(error)}")
+            failed_count += 1
+            continue
+        shard_infos.append(info)
+        if mode == 'move':
+            for _, members in shard[2]:
+                for path in members.values():
+                    os.remove(path)
+
+    shard_infos.sort(key=lambda info: info['path'])
+    with open(os.path.join(target_dir, 'index.jsonl'), 'w', encoding='utf-8') as f:
+        for info in shard_infos:
+            for entry in info.pop('entries'):
+                f.write(json.dumps({'shard': info['path'], **entry}, ensure_ascii=False) + '\n')
+    with open(os.path.join(target_dir, 'shards.json'), 'w', encoding='utf-8') as f:
+        json.dump({'shards': shard_infos}, f, ensure_ascii=False, indent=2)
+
+    print(f"\n共写入 {len(shard_infos)} 个分片")
+    for split in ('train', 'val'):
+        split_infos = [info for info in shard_infos if info['split'] == split]
+        print(f"- {split}: {len(split_infos)} 个分片，{sum(i['samples'] for i in split_infos)} 个样本")
+    print(f"- 失败: {failed_count} 个分片")
+
+def organize_dataset(source_dir, target_dir, mode='copy', structure_type='simple',
+                     link='copy', workers=8, journal=None, plan_only=False,
+                     sync=False, checksum=False, delete=False,
+                     shard_size=1 << 30, shard_samples=None, assigner=None):
+    """
+    整理数据集文件
+    
+    Args:
+        source_dir (str): 源数据集目录
+        target_dir (str): 目标目录
+        mode (str): 'copy' 或 'move'，决定是复制还是移动文件
+        structure_type (str): 目标数据集结构类型
+        link (str): 复制模式下的文件落地方式（copy/hard/sym/reflink），不支持时自动回退为复制
+        workers (int): 并发执行文件操作的线程数
+        journal (str): 计划日志路径；已存在时直接从日志恢复执行，不再扫描源目录
+        plan_only (bool): 只生成计划日志，不执行文件操作
+        sync (bool): 增量同步（仅复制模式），只传输新增或变化的文件
+        checksum (bool): 增量同步时比较内容哈希而不是修改时间
+        delete (bool): 删除目标目录中源数据集已不存在的文件
+        shard_size (int): shards 结构下每个分片的最大字节数
+        shard_samples (int): shards 结构下每个分片的最大样本数
+        assigner (SplitAssigner): 分割生成器，指定时重新生成训练/验证集分割
+    """
+    if assigner is not None and structure_type not in ('split', 'shards'):
+        print(f"提示: {structure_type} 结构不区分训练/验证集，忽略分割生成")
+        assigner = None
+
+    if structure_type == 'shards':
+        if journal or sync or delete:
+            print("错误：shards 结构不支持 --journal/--sync/--delete")
+            return False
+        create_target_structure(target_dir, structure_type)
+        if assigner is not None:
+            assigner.prepare(source_dir)
+            assigner.print_summary()
+        pack_shards(source_dir, target_dir, mode, shard_size, shard_samples, workers, assigner)
+        return True
+
+    # 影响计划内容或执行方式的参数都记录在日志头中，恢复时参数不一致会被拒绝
+    header = {'source_dir': str(source_dir), 'target_dir': str(target_dir),
+              'mode': mode, 'structure': structure_type,
+              'split': None if assigner is None else {
+                  'val_ratio': assigner.val_ratio, 'seed': assigner.seed,
+                  'stratify': assigner.stratify},
+              'sync': sync, 'checksum': checksum, 'delete': delete,
+              'shard_size': shard_size, 'shard_samples': shard_samples}
+    done = set()
+
+    if journal and os.path.exists(journal) and not plan_only:
+        journal_header, plan, done = load_journal(journal)
+        if journal_header != header:
+            print(f"错误：计划日志 {journal} 与当前参数不一致: {journal_header}")
+            return False
+        print(f"从计划日志加载 {len(plan)} 个条目: {journal}")
+    else:
+        if assigner is not None:
+            assigner.prepare(source_dir)
+            assigner.print_summary()
+        plan, collisions = plan_dataset(source_dir, target_dir, structure_type, assigner)
+        if collisions:
+            print(f"警告: {len(collisions)} 个文件与其他文件的目标路径冲突，已跳过:")
+            for source_file, target_file in collisions[:10]:
+                print(f"  {source_file} -> {target_file}")
+            if len(collisions) > 10:
+                print(f"  ... 以及另外 {len(collisions) - 10} 个")
+        if journal:
+            write_journal(journal, header, plan)
+            print(f"计划已写入: {journal}（{len(plan)} 个条目）")
+        if plan_only:
+            return True
+
+    # 创建目标结构
+    create_target_structure(target_dir, structure_type)
+    execute_plan(plan, source_dir, target_dir, mode, link, workers, journal, done,
+                 sync=sync, checksum=checksum)
+
+    if delete:
+        keep = [journal, journal + '.progress'] if journal else []
+        deleted = delete_stale_files(target_dir, plan, keep,
+                                     DATASET_STRUCTURES[structure_type]['dirs'])
+        print(f"- 删除过期文件: {deleted} 个")
+    return True
 
 def main():
     parser = argparse.ArgumentParser(description='数据集整理工具')
@@ -93,6 +525,21 @@ def main():
     parser.add_argument('target_dir', help='目标目录')
     parser.add_argument('--mode', choices=['copy', 'move'], default='copy',help='操作模式: copy(复制) 或 move(移动)')
     parser.add_argument('--structure', choices=list(DATASET_STRUCTURES.keys()),default='simple', help='目标数据集结构类型')
+    parser.add_argument('--link', choices=LINK_MODES, default='copy',
+                        help='复制模式下的文件落地方式: copy(复制)、hard(硬链接)、sym(符号链接)、reflink(写时复制)，不支持时自动回退为复制')
+    parser.add_argument('--workers', type=int, default=8, help='并发执行文件操作的线程数（默认: 8）')
+    parser.add_argument('--shard-size', type=int, default=1024, help='shards 结构下每个分片的最大大小（MB，默认: 1024）')
+    parser.add_argument('--shard-samples', type=int, default=None, help='shards 结构下每个分片的最大样本数（默认不限制）')
+    parser.add_argument('--generate-split', action='store_true',
+                        help='split/shards 结构下按文件名哈希重新生成训练/验证集分割，忽略源目录中的 train/val')
+    parser.add_argument('--val-ratio', type=float, default=0.1, help='生成分割时验证集的比例（默认: 0.1）')
+    parser.add_argument('--split-seed', type=int, default=0, help='生成分割的随机种子（默认: 0）')
+    parser.add_argument('--stratify', action='store_true', help='生成分割时按类别分层，保证各类别的验证集比例')
+    parser.add_argument('--sync', action='store_true', help='增量同步（仅复制模式）：按大小和修改时间跳过未变化的文件')
+    parser.add_argument('--checksum', action='store_true', help='增量同步时比较内容哈希而不是修改时间')
+    parser.add_argument('--delete', action='store_true', help='删除目标目录中源数据集已不存在的文件')
+    parser.add_argument('--journal', help='计划日志路径：不存在时生成计划并记录执行进度，已存在时从中断处继续')
+    parser.add_argument('--plan-only', action='store_true', help='只生成计划日志（需配合 --journal），不执行文件操作')
     
     args = parser.parse_args()
     
@@ -102,8 +549,27 @@ def main():
     
     print(f"\n选择的结构: {args.structure}")
     print(f"开始{'复制' if args.mode == 'copy' else '移动'}数据集...")
-    organize_dataset(args.source_dir, args.target_dir, args.mode, args.structure)
-    print("\n完成！")
+    if args.mode == 'move' and (args.sync or args.checksum):
+        print("错误：--sync/--checksum 只能用于复制模式")
+        return
+    
+    assigner = None
+    if args.generate_split or args.stratify:
+        if not 0 <= args.val_ratio <= 1:
+            print("错误：--val-ratio 必须在 0 到 1 之间")
+            return
+        assigner = SplitAssigner(args.val_ratio, args.split_seed, args.stratify)
+    
+    if args.plan_only and not args.journal:
+        print("错误：--plan-only 需要同时指定 --journal")
+        return
+    
+    success = organize_dataset(args.source_dir, args.target_dir, args.mode, args.structure,
+                               args.link, args.workers, args.journal, args.plan_only,
+                               args.sync or args.checksum, args.checksum, args.delete,
+                               args.shard_size * 1024 * 1024, args.shard_samples, assigner)
+    if success:
+        print("\n完成！")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
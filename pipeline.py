@@ -0,0 +1,326 @@
+import os
+import re
+import argparse
+from collections import defaultdict
+from tqdm import tqdm
+from change import ClassIdRemapper, FIRST_TOKEN_PATTERN, create_number_mapping, remap_bytes, write_txt_file
+from extract import parse_query, match_label_counts, build_image_map
+from statistic import get_txt_files, get_default_output_path, save_statistics
+from materialize import LINK_MODES, materialize_file
+
+STAGE_HELP = """处理阶段（按给出的顺序依次执行，可重复指定）:
+  remap=23:32,24:33    类别映射，格式同 change.py --mapping
+  drop=5,6             删除指定类别的标注行
+  filter=2 AND NOT 5   按标签查询表达式筛选文件，语法同 extract.py --query；
+                       不满足的文件不再进入后续阶段；指定 --output 时不会被写出，
+                       原位模式下仍会写回此前阶段做出的修改
+  clip                 将坐标裁剪到 [0, 1]
+  count                统计当前阶段的标签ID出现次数"""
+
+# 一行中的每个字段
+FIELD_PATTERN = re.compile(rb'[^\s]+')
+
+def normalize_label(token):
+    """
+    统一标签ID的写法，所有阶段按同一规则比较标签
+
+    与 change.py 的 ClassIdRemapper 一致按数值比较：b"5"、b"5.0"、b"05" 均视为 "5"；
+    不是数字的标签保持原样。
+    """
+    if isinstance(token, bytes):
+        token = token.decode('utf-8', errors='replace')
+    try:
+        value = float(token)
+    except ValueError:
+        return token
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def normalize_query(node):
+    """将查询语法树中的标签按 normalize_label 统一写法"""
+    kind = node[0]
+    if kind == 'label':
+        return ('label', normalize_label(node[1]))
+    if kind == 'count':
+        return ('count', normalize_label(node[1])) + tuple(node[2:])
+    return (kind,) + tuple(normalize_query(child) for child in node[1:])
+
+def line_label(line):
+    """一行的标签ID（已统一写法），空行返回None"""
+    match = FIRST_TOKEN_PATTERN.match(line)
+    return normalize_label(match.group(1)) if match else None
+
+def format_like(token, value):
+    """按原字段的小数位数格式化新值，如 1.0312 裁剪为 1 时写作 1.0000"""
+    mantissa = re.split(rb'[eE]', token)[0]
+    if b'.' in mantissa:
+        decimals = len(mantissa.split(b'.', 1)[1])
+        return f"{value:.{decimals}f}".encode()
+    return str(int(value)).encode()
+
+class LabelRecord:
+    """
+    单个标注文件在流水线中的状态
+
+    按行保存原始字节（含换行符），各阶段只替换发生变化的字段或删除整行，
+    未改动的字节（空白、数值格式、空行、换行符）原样写回。
+    """
+
+    def __init__(self, path, raw):
+        self.path = path
+        self.lines = raw.splitlines(keepends=True)
+        self.modified = False
+
+    def label_counts(self):
+        """当前内容中每个标签ID的出现次数"""
+        counts = defaultdict(int)
+        for line in self.lines:
+            label = line_label(line)
+            if label is not None:
+                counts[label] += 1
+        return counts
+
+    def to_bytes(self):
+        return b''.join(self.lines)
+
+def make_remap_stage(arg):
+    """类别映射阶段，复用 change.py 的字节查找表和逐字段替换"""
+    remapper = ClassIdRemapper(create_number_mapping(arg))
+
+    def remap(record):
+        for i, line in enumerate(record.lines):
+            new_line, _ = remap_bytes(line, remapper)
+            if new_line is not None:
+                record.lines[i] = new_line
+                record.modified = True
+        return True
+    return remap
+
+def make_drop_stage(arg):
+    """删除指定类别的标注行"""
+    dropped = {normalize_label(label.strip()) for label in arg.split(',') if label.strip()}
+
+    def drop(record):
+        kept = [line for line in record.lines if line_label(line) not in dropped]
+        if len(kept) != len(record.lines):
+            record.lines = kept
+            record.modified = True
+        return True
+    return drop
+
+def make_filter_stage(arg):
+    """按标签查询表达式筛选文件，复用 extract.py 的查询语法"""
+    tree = normalize_query(parse_query(arg))
+
+    def filter_file(record):
+        return match_label_counts(tree, record.label_counts())
+    return filter_file
+
+def make_clip_stage(arg=None):
+    """将坐标裁剪到 [0, 1]，只替换越界的字段，并保留其小数位数"""
+    def clip(record):
+        for i, line in enumerate(record.lines):
+            pieces = None
+            last = 0
+            for match in list(FIELD_PATTERN.finditer(line))[1:]:
+                token = match.group()
+                try:
+                    value = float(token)
+                except ValueError:
+                    continue
+                if 0 <= value <= 1 or value != value:
+                    continue
+                if pieces is None:
+                    pieces = []
+                pieces.append(line[last:match.start()])
+                pieces.append(format_like(token, 0 if value < 0 else 1))
+                last = match.end()
+            if pieces is not None:
+                pieces.append(line[last:])
+                record.lines[i] = b''.join(pieces)
+                record.modified = True
+        return True
+    return clip
+
+class CountStage:
+    """统计阶段，结果格式与 statistic.py 的 statistic() 返回值一致"""
+
+    def __init__(self, arg=None):
+        self.total_files = 0
+        self.total_lines = 0
+        self.total_counts = defaultdict(int)
+        self.file_counts = {}
+
+    def __call__(self, record):
+        counts = record.label_counts()
+        self.total_files += 1
+        for label, count in counts.items():
+            self.total_counts[label] += count
+            self.total_lines += count
+        if counts:
+            self.file_counts[record.path] = dict(counts)
+        return True
+
+    def stats(self):
+        return {
+            'total_files': self.total_files,
+            'total_lines': self.total_lines,
+            'total_ids': len(self.total_counts),
+            'total_counts': dict(self.total_counts),
+            'file_counts': self.file_counts
+        }
+
+STAGE_FACTORIES = {
+    'remap': make_remap_stage,
+    'drop': make_drop_stage,
+    'filter': make_filter_stage,
+    'clip': make_clip_stage,
+    'count': CountStage,
+}
+
+def build_pipeline(stage_specs):
+    """
+    解析阶段描述列表，如 ["remap=23:32", "drop=5", "count"]
+
+    Returns:
+        list: [(阶段名, 可调用对象), ...]
+    """
+    stages = []
+    for spec in stage_specs:
+        name, _, arg = spec.partition('=')
+        name = name.strip().lower()
+        if name not in STAGE_FACTORIES:
+            raise ValueError(f"未知的处理阶段: {name}，可选: {', '.join(STAGE_FACTORIES)}")
+        if name in ('remap', 'drop', 'filter') and not arg.strip():
+            raise ValueError(f"处理阶段 {name} 需要参数，例如 {name}=...")
+        stages.append((name, STAGE_FACTORIES[name](arg.strip() or None)))
+    return stages
+
+def run_pipeline(directory, stages, recursive=False, output_dir=None, backup=True, link='copy'):
+    """
+    单次遍历标注文件，让每个文件依次经过所有处理阶段
+
+    Args:
+        directory: 标注文件所在文件夹
+        stages: build_pipeline 返回的阶段列表
+        recursive: 是否递归处理子文件夹
+        output_dir: 输出文件夹；为None时在原位置写回被修改的文件，
+                    指定时写出所有通过筛选的标注文件及其对应图片；
+                    原位模式下 filter 只决定文件是否进入后续阶段
+        backup: 原位写回时是否创建 .bak 备份
+        link: 输出图片的落地方式（copy/hard/sym/reflink）
+    Returns:
+        dict: 处理统计，失败时返回None
+    """
+    try:
+        txt_files = get_txt_files(directory, recursive)
+        written_files = 0
+        filtered_files = 0
+        skipped_files = 0
+        image_maps = {}
+
+        for txt_file in tqdm(txt_files, desc="处理文件"):
+            try:
+                with open(txt_file, 'rb') as f:
+                    raw = f.read()
+                record = LabelRecord(txt_file, raw)
+                passed = all(stage(record) for _, stage in stages)
+                if not passed:
+                    filtered_files += 1
+
+                if output_dir is None:
+                    # 被筛除的文件跳过后续阶段，但此前阶段的修改仍要写回
+                    if record.modified:
+                        if backup and not os.path.exists(txt_file + '.bak'):
+                            write_txt_file(txt_file + '.bak', raw)
+                        write_txt_file(txt_file, record.to_bytes())
+                        written_files += 1
+                    continue
+                if not passed:
+                    continue
+
+                rel_path = os.path.relpath(txt_file, directory)
+                target_file = os.path.join(output_dir, rel_path)
+                os.makedirs(os.path.dirname(target_file), exist_ok=True)
+                write_txt_file(target_file, record.to_bytes() if record.modified else raw)
+                written_files += 1
+
+                # 同一文件夹的图片只扫描一次
+                folder = os.path.dirname(txt_file)
+                if folder not in image_maps:
+                    image_maps[folder] = build_image_map(folder)
+                image_path = image_maps[folder].get(os.path.splitext(os.path.basename(txt_file))[0])
+                if image_path is not None:
+                    materialize_file(image_path, os.path.join(os.path.dirname(target_file),
+                                                              os.path.basename(image_path)), link)
+            except Exception as e:
+                print(f"\n处理文件 {txt_file} 时出错: {str(e)}")
+                skipped_files += 1
+                continue
+
+        print(f"\n处理完成!")
+        print(f"处理文件: {len(txt_files)} 个")
+        print(f"{'写出' if output_dir else '已修改'}: {written_files} 个文件")
+        print(f"被筛除: {filtered_files} 个文件")
+        print(f"跳过/失败: {skipped_files} 个文件")
+
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+        return None
+
+    return {
+        'total_files': len(txt_files),
+        'written_files': written_files,
+        'filtered_files': filtered_files,
+        'skipped_files': skipped_files,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='单次遍历对标注文件执行多个处理阶段',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=STAGE_HELP)
+    parser.add_argument('--dir', '-d', type=str, required=True,
+                      help='标注文件所在文件夹路径')
+    parser.add_argument('--stage', '-s', action='append', required=True,
+                      help='处理阶段，按顺序执行，可重复指定（见下方说明）')
+    parser.add_argument('--output', '-o', type=str, default=None,
+                      help='输出文件夹（默认在原位置写回被修改的文件）')
+    parser.add_argument('--recurse', action='store_true',
+                      help='递归处理子文件夹')
+    parser.add_argument('--no-backup', '-nb', action='store_true', default=False,
+                      help='原位写回时不创建备份文件')
+    parser.add_argument('--link', choices=LINK_MODES, default='copy',
+                      help='输出图片的落地方式，不支持时自动回退为复制')
+    parser.add_argument('--stat-output', type=str, default=None,
+                      help='count 阶段统计报告的输出文件夹（默认与输入放在一起）')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dir):
+        print("错误：指定的文件夹不存在！")
+        return 1
+
+    try:
+        stages = build_pipeline(args.stage)
+    except ValueError as e:
+        print(f"错误：{str(e)}")
+        return 1
+
+    result = run_pipeline(args.dir, stages, args.recurse, args.output,
+                          not args.no_backup, args.link)
+    if result is None:
+        return 1
+
+    # 保存每个 count 阶段的统计报告
+    count_stages = [stage for name, stage in stages if name == 'count']
+    for i, stage in enumerate(count_stages):
+        output_path = get_default_output_path(args.dir, args.stat_output)
+        if len(count_stages) > 1:
+            name, ext = os.path.splitext(output_path)
+            output_path = f"{name}_{i + 1}{ext}"
+        save_statistics(stage.stats(), output_path)
+        print(f"统计结果已保存至: {os.path.abspath(output_path)}")
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
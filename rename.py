@@ -1,9 +1,170 @@
 import os
 import re
+import json
 import argparse
+from datetime import datetime
+from collections import defaultdict
 from tqdm import tqdm
 
-def rename_files(folder_path, number_change, file_types=None, dry_run=False):
+# 默认的回滚日志文件名前缀（位于处理文件夹下，每次运行附加时间戳）
+DEFAULT_JOURNAL_PREFIX = 'rename_journal'
+
+def default_journal_path(folder_path):
+    """
+    生成本次运行的默认回滚日志路径，如 rename_journal_20240101_120000.jsonl
+
+    同一秒内多次运行时追加序号，保证不会与之前的回滚日志重名。
+    """
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(folder_path, f"{DEFAULT_JOURNAL_PREFIX}_{stamp}.jsonl")
+    index = 1
+    while os.path.lexists(path):
+        path = os.path.join(folder_path, f"{DEFAULT_JOURNAL_PREFIX}_{stamp}_{index}.jsonl")
+        index += 1
+    return path
+
+def plan_renames(files, number_change):
+    """
+    计算重命名计划，用集合检测冲突，整体为 O(n)
+
+    Args:
+        files: 文件名列表
+        number_change: 数字变化量
+    Returns:
+        tuple: (重命名列表 [(旧文件名, 新文件名), ...], 跳过列表 [(文件名, 原因), ...])
+    """
+    candidates = []
+    skipped = []
+    for filename in files:
+        # 使用正则表达式匹配文件名中的数字
+        match = re.match(r'(\d+)(\..*)', filename)
+        if not match:
+            skipped.append((filename, "未找到数字"))
+            continue
+
+        # 计算新数字
+        new_number = int(match.group(1)) + number_change
+        if new_number < 0:
+            skipped.append((filename, "重命名后数字为负"))
+            continue
+
+        # 构建新文件名
+        candidates.append((filename, f"{new_number:d}{match.group(2)}"))
+
+    # 多个文件映射到同一个新文件名（如 01.jpg 与 1.jpg）时全部跳过
+    target_counts = defaultdict(int)
+    for _, new_filename in candidates:
+        target_counts[new_filename] += 1
+
+    existing = set(files)
+    sources = {filename for filename, _ in candidates}
+    renames = []
+    for filename, new_filename in candidates:
+        if target_counts[new_filename] > 1:
+            skipped.append((filename, f"与其他文件都会重命名为 {new_filename}"))
+        elif new_filename != filename and new_filename in existing and new_filename not in sources:
+            # 目标被一个不参与重命名的文件占用
+            skipped.append((filename, f"{new_filename} 已存在"))
+        elif new_filename != filename:
+            renames.append((filename, new_filename))
+
+    # 被跳过的文件仍占用原文件名，依赖它腾出位置的重命名也要跳过；
+    # 用 目标 -> 源 的反向映射沿依赖链传播，每个重命名最多处理一次
+    source_of = {new_filename: filename for filename, new_filename in renames}
+    moving = set(source_of.values())
+    blocked = set()
+    worklist = [filename for filename, new_filename in renames
+                if new_filename in existing and new_filename not in moving]
+    while worklist:
+        filename = worklist.pop()
+        if filename in blocked:
+            continue
+        blocked.add(filename)
+        # 以 filename 为目标的重命名现在被它占用
+        waiting = source_of.get(filename)
+        if waiting is not None and waiting not in blocked:
+            worklist.append(waiting)
+
+    skipped.extend((f, f"{n} 已存在") for f, n in renames if f in blocked)
+    renames = [(f, n) for f, n in renames if f not in blocked]
+    return renames, skipped
+
+def order_renames(renames, existing):
+    """
+    按数字方向排序：数字增大时从大到小、减小时从小到大执行，使每个目标在使用前已被腾出
+
+    Args:
+        renames: 重命名列表 [(旧文件名, 新文件名), ...]
+        existing: 文件夹中当前存在的全部文件名
+    Returns:
+        tuple: (排序后的重命名列表, 是否存在循环需要两阶段重命名)
+    """
+    def number_of(filename):
+        match = re.match(r'(\d+)', filename)
+        return int(match.group(1)) if match else 0
+
+    increasing = sum(1 if number_of(new) > number_of(old) else -1 for old, new in renames) > 0
+    ordered = sorted(renames, key=lambda op: number_of(op[0]), reverse=increasing)
+
+    # 模拟执行，若某个目标在轮到它时仍被占用，则存在循环
+    occupied = set(existing)
+    for old, new in ordered:
+        if new in occupied:
+            return ordered, True
+        occupied.discard(old)
+        occupied.add(new)
+    return ordered, False
+
+def execute_renames(folder_path, renames, two_phase, journal_path=None):
+    """
+    执行重命名，并把计划和每一步的完成情况写入回滚日志
+
+    两阶段模式下先把所有文件改为临时名，再改为最终名，可处理任意循环。
+    执行顺序依赖前面的步骤腾出文件名，因此任何一步失败都会停止后续操作，
+    已完成的部分可以用回滚日志撤销。
+
+    Returns:
+        tuple: (成功数, 失败数)
+    """
+    entries = []
+    for i, (old, new) in enumerate(renames):
+        entry = {'old': old, 'new': new}
+        if two_phase:
+            entry['tmp'] = f".rename_tmp_{os.getpid()}_{i}"
+        entries.append(entry)
+
+    journal = None
+    if journal_path:
+        # 'x' 模式：已有的回滚日志不会被覆盖
+        journal = open(journal_path, 'x', encoding='utf-8')
+        journal.write(json.dumps({'folder': os.path.abspath(folder_path)}, ensure_ascii=False) + '\n')
+        for entry in entries:
+            journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        journal.flush()
+
+    phases = [('old', 'tmp'), ('tmp', 'new')] if two_phase else [('old', 'new')]
+    try:
+        for phase, (src_key, dst_key) in enumerate(phases):
+            for i, entry in enumerate(tqdm(entries, desc="重命名")):
+                dst = os.path.join(folder_path, entry[dst_key])
+                try:
+                    # os.rename 在 POSIX 上会静默覆盖，先确认目标未被占用
+                    if os.path.lexists(dst):
+                        raise FileExistsError(f"{entry[dst_key]} 已存在")
+                    os.rename(os.path.join(folder_path, entry[src_key]), dst)
+                except Exception as e:
+                    print(f"\n处理 {entry['old']} 时出错: {str(e)}，已停止后续重命名")
+                    completed = i if phase == len(phases) - 1 else 0
+                    return completed, len(entries) - completed
+                if journal is not None:
+                    journal.write(f'{{"done": {i}, "phase": {phase}}}\n')
+                    journal.flush()
+    finally:
+        if journal is not None:
+            journal.close()
+    return len(entries), 0
+
+def rename_files(folder_path, number_change, file_types=None, dry_run=False, journal_path=None):
     """
     批量重命名文件，修改文件名中的数字
     
@@ -12,6 +173,8 @@ def rename_files(folder_path, number_change, file_types=None, dry_run=False):
         number_change: 数字变化量（可以是正数或负数）
         file_types: 要处理的文件类型列表，默认为 ['.txt', '.jpg', '.png']
         dry_run: 如果为True，只显示会进行的更改但不实际执行
+        journal_path: 回滚日志路径，为None时在处理文件夹下生成带时间戳的新日志；
+                      显式指定的路径已存在时拒绝执行，避免覆盖上一次的回滚记录
     """
     if file_types is None:
         file_types = ['.txt', '.jpg', '.png']
@@ -23,8 +186,8 @@ def rename_files(folder_path, number_change, file_types=None, dry_run=False):
 
     # 获取所有文件并排序
     try:
-        files = [f for f in os.listdir(folder_path) 
-                if os.path.splitext(f)[1].lower() in file_types]
+        all_files = os.listdir(folder_path)
+        files = [f for f in all_files if os.path.splitext(f)[1].lower() in file_types]
         files.sort()
     except Exception as e:
         print(f"读取文件夹时出错: {str(e)}")
@@ -34,86 +197,129 @@ def rename_files(folder_path, number_change, file_types=None, dry_run=False):
         print("未找到符合条件的文件")
         return True
 
-    # 保存重命名操作的映射，用于检查冲突
-    rename_map = {}
-    processed = 0
-    skipped = 0
-    
     print(f"{'预览更改' if dry_run else '开始重命名'}...")
-    
-    # 使用tqdm创建进度条
-    for filename in tqdm(files, desc="处理文件"):
-        try:
-            # 使用正则表达式匹配文件名中的数字
-            match = re.match(r'(\d+)(\..*)', filename)
-            if not match:
-                if not dry_run:
-                    print(f"跳过 {filename} - 未找到数字")
-                skipped += 1
-                continue
-
-            # 提取数字和扩展名
-            number = int(match.group(1))
-            extension = match.group(2)
-            
-            # 计算新数字
-            new_number = number + number_change
-            if new_number < 0:
-                print(f"警告：{filename} 重命名后数字为负，已跳过")
-                skipped += 1
-                continue
-                
-            # 构建新文件名
-            new_filename = f"{new_number:d}{extension}"
-            
-            # 检查是否会覆盖现有文件
-            if new_filename in rename_map.values() or \
-               (os.path.exists(os.path.join(folder_path, new_filename)) and \
-                new_filename != filename):
-                print(f"警告：{filename} -> {new_filename} 会造成冲突，已跳过")
-                skipped += 1
-                continue
-            
-            old_path = os.path.join(folder_path, filename)
-            new_path = os.path.join(folder_path, new_filename)
-            
-            if dry_run:
-                print(f"将重命名: {filename} -> {new_filename}")
-            else:
-                os.rename(old_path, new_path)
-            
-            rename_map[filename] = new_filename
-            processed += 1
-            
-        except Exception as e:
-            print(f"\n处理 {filename} 时出错: {str(e)}")
-            skipped += 1
-            continue
+
+    renames, skipped = plan_renames(files, number_change)
+    for filename, reason in skipped:
+        print(f"警告：跳过 {filename} - {reason}")
+
+    ordered, two_phase = order_renames(renames, all_files)
+
+    if dry_run:
+        for old, new in ordered:
+            print(f"将重命名: {old} -> {new}")
+        processed, failed = len(ordered), 0
+    else:
+        if journal_path is None:
+            journal_path = default_journal_path(folder_path)
+        elif os.path.lexists(journal_path):
+            print(f"错误：回滚日志 {journal_path} 已存在，为避免覆盖上一次的回滚记录，"
+                  f"请用 --journal 指定新的路径或省略该参数")
+            return False
+        if two_phase:
+            print("检测到循环依赖，使用两阶段重命名")
+        processed, failed = execute_renames(folder_path, ordered, two_phase, journal_path)
+        print(f"回滚日志已保存至: {journal_path}")
 
     # 打印统计信息
     print(f"\n{'预览' if dry_run else '重命名'}完成!")
     print(f"处理成功: {processed} 个文件")
-    print(f"跳过/失败: {skipped} 个文件")
+    print(f"跳过/失败: {len(skipped) + failed} 个文件")
     
     return True
 
+def rollback_renames(journal_path):
+    """
+    根据回滚日志按相反顺序撤销已完成的重命名，可用于中途中断的任务
+
+    Args:
+        journal_path: rename_files 写出的回滚日志路径
+    """
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            folder_path = json.loads(f.readline())['folder']
+            entries = []
+            done = []
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 中断时未写完的最后一行
+                if 'done' in record:
+                    done.append((record['phase'], record['done']))
+                else:
+                    entries.append(record)
+    except Exception as e:
+        print(f"读取回滚日志时出错: {str(e)}")
+        return False
+
+    two_phase = any('tmp' in entry for entry in entries)
+    phases = [('old', 'tmp'), ('tmp', 'new')] if two_phase else [('old', 'new')]
+
+    # 日志在每步完成后写入，中断时最多有紧随其后的一步已执行但未记录
+    if len(done) < len(entries) * len(phases):
+        phase, i = divmod(len(done), len(entries))
+        src_key, dst_key = phases[phase]
+        entry = entries[i]
+        if (not os.path.lexists(os.path.join(folder_path, entry[src_key])) and
+                os.path.lexists(os.path.join(folder_path, entry[dst_key]))):
+            done.append((phase, i))
+
+    if not done:
+        print("没有需要回滚的文件")
+        return True
+
+    print(f"开始回滚 {len(done)} 步重命名...")
+    reverted = 0
+    for phase, i in tqdm(list(reversed(done)), desc="回滚"):
+        src_key, dst_key = phases[phase]
+        entry = entries[i]
+        try:
+            # 与正向重命名相同：目标已被占用（如重命名后新建了同名文件）时不覆盖
+            target = os.path.join(folder_path, entry[src_key])
+            if os.path.lexists(target):
+                raise FileExistsError(f"{entry[src_key]} 已存在")
+            os.rename(os.path.join(folder_path, entry[dst_key]), target)
+            reverted += 1
+        except Exception as e:
+            print(f"\n回滚 {entry[dst_key]} -> {entry[src_key]} 时出错: {str(e)}，已停止")
+            break
+
+    print(f"\n回滚完成!")
+    print(f"处理成功: {reverted} 步")
+    print(f"失败: {len(done) - reverted} 步")
+    return reverted == len(done)
+
 def main():
     parser = argparse.ArgumentParser(description='批量重命名文件中的数字')
-    parser.add_argument('--folder', '-f', type=str, required=True,
+    parser.add_argument('--folder', '-f', type=str,
                       help='要处理的文件夹路径')
-    parser.add_argument('--change', '-c', type=int, required=True,
+    parser.add_argument('--change', '-c', type=int,
                       help='数字增加的数量（可以为负数）')
     parser.add_argument('--types', '-t', type=str, default='.txt,.jpg,.png',
                       help='要处理的文件类型，用逗号分隔 (默认: .txt,.jpg,.png)')
     parser.add_argument('--dry-run', '-d', action='store_true',
                       help='预览模式：只显示将进行的更改，不实际重命名')
+    parser.add_argument('--journal', '-j', type=str, default=None,
+                      help=f'回滚日志路径，已存在时拒绝执行（默认: 处理文件夹下新建 '
+                           f'{DEFAULT_JOURNAL_PREFIX}_<时间戳>.jsonl）')
+    parser.add_argument('--rollback', '-r', type=str, default=None,
+                      help='根据回滚日志撤销之前的重命名')
 
     args = parser.parse_args()
+
+    if args.rollback:
+        return 0 if rollback_renames(args.rollback) else 1
+
+    if args.folder is None or args.change is None:
+        parser.error('需要指定 --folder 和 --change（或使用 --rollback）')
     
     file_types = [t.strip() if t.startswith('.') else f'.{t.strip()}' 
                  for t in args.types.split(',')]
     
-    success = rename_files(args.folder, args.change, file_types, args.dry_run)
+    success = rename_files(args.folder, args.change, file_types, args.dry_run, args.journal)
     return 0 if success else 1
 
 if __name__ == "__main__":
@@ -1,8 +1,23 @@
 import os
+import csv
+import json
+import sqlite3
 import argparse
 from collections import defaultdict
+import numpy as np
 from tqdm import tqdm
 
+# 每行标注的字段数：类别ID + 四边形4个顶点的归一化坐标
+QUAD_FIELDS = 9
+# 向量化分析支持的最大类别ID，超出的行计为格式错误
+MAX_CLASS_ID = 65535
+# 面积直方图（对数刻度，归一化面积）与长宽比直方图（log2刻度）的分箱
+AREA_BINS = np.logspace(-6, 0, 25)
+ASPECT_BINS = np.linspace(-4, 4, 33)
+COORD_BINS = np.linspace(0, 1, 21)
+# 计数缓存每重新解析这么多个文件提交一次，中断时已提交的解析结果不会丢失
+CACHE_COMMIT_INTERVAL = 1000
+
 def read_txt_file(file_path):
     """读取文件内容"""
     if not os.path.exists(file_path):
@@ -29,8 +44,82 @@ def get_txt_files(path, recurse=False):
                 txt_files.append(os.path.join(path, file))
     return txt_files
 
-def statistic(path, recurse=False):
-    """统计文件或文件夹中的标签ID并返回统计结果"""
+def count_labels(txt_file):
+    """统计单个txt文件中各标签ID的出现次数（逐行读取），文件不存在时返回None"""
+    if not os.path.exists(txt_file):
+        print("文件未找到: ", txt_file)
+        return None
+
+    current_file_counts = defaultdict(int)
+    with open(txt_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    id_value = line.strip().split()[0]
+                    current_file_counts[id_value] += 1
+                except Exception as e:
+                    print(f"\n错误处理文件 {txt_file} 中的行: {line}, 错误信息: {e}")
+    return dict(current_file_counts)
+
+def open_count_cache(cache_path):
+    """打开（必要时创建）保存每个文件标签计数的SQLite缓存"""
+    conn = sqlite3.connect(cache_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS file_counts ("
+        "path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+        "mtime_ns INTEGER NOT NULL, counts TEXT NOT NULL)"
+    )
+    return conn
+
+def in_scan_scope(key, path, recurse=False):
+    """
+    判断缓存中的文件是否属于本次扫描范围，只有范围内已不存在的文件才从缓存中移除
+
+    同一个缓存文件可能被不同目录或单文件的统计共用，范围外的记录保持不变。
+    """
+    root = os.path.abspath(path)
+    if os.path.isfile(root):
+        return key == root
+    if recurse:
+        return key.startswith(os.path.join(root, ''))
+    return os.path.dirname(key) == root
+
+def save_count_rows(conn, rows):
+    """将一批 (路径, 大小, 修改时间, 计数JSON) 写入计数缓存并提交"""
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO file_counts (path, size, mtime_ns, counts) "
+            "VALUES (?, ?, ?, ?)", rows)
+
+def iter_scope_keys(conn, path, recurse=False):
+    """按路径前缀在主键索引上范围查询，只读取扫描范围内的缓存记录"""
+    root = os.path.abspath(path)
+    if os.path.isfile(root):
+        rows = conn.execute("SELECT path FROM file_counts WHERE path = ?", (root,))
+    else:
+        prefix = os.path.join(root, '')
+        rows = conn.execute("SELECT path FROM file_counts WHERE path >= ? AND path < ?",
+                            (prefix, prefix + '\U0010ffff'))
+    for (key,) in rows:
+        if in_scan_scope(key, path, recurse):
+            yield key
+
+def get_default_cache_path(output_path):
+    """生成默认的缓存文件路径（与输出文件放在一起）"""
+    name, _ = os.path.splitext(output_path)
+    return f"{name}_cache.sqlite"
+
+def statistic(path, recurse=False, cache_path=None, on_file=None, keep_file_counts=True):
+    """
+    统计文件或文件夹中的标签ID并返回统计结果
+
+    Args:
+        path: 输入文件或文件夹路径
+        recurse: 是否递归子文件夹
+        cache_path: 计数缓存文件路径；指定后仅重新解析新增或修改过的文件
+        on_file: 每统计完一个文件即调用 on_file(文件路径, 计数字典)，用于流式输出
+        keep_file_counts: 是否在结果中保留按文件统计；为False时内存中只保留总体计数
+    """
     txt_files = get_txt_files(path, recurse)
     if not txt_files:
         print(f"未找到任何txt文件在: {path}")
@@ -39,6 +128,15 @@ def statistic(path, recurse=False):
     total_counts = defaultdict(int)
     file_counts = {}
     total_lines = 0
+
+    # 缓存按绝对路径逐个查询，新解析的结果分批写回
+    conn = None
+    updated_rows = []
+    seen_keys = set()
+    cache_hits = 0
+    reparsed = 0
+    if cache_path:
+        conn = open_count_cache(cache_path)
     
     with tqdm(total=len(txt_files), 
              desc="处理文件", 
@@ -46,37 +144,258 @@ def statistic(path, recurse=False):
              colour="green") as pbar:
         
         for txt_file in txt_files:
-            content = read_txt_file(txt_file)
-            if content is None:
+            current_file_counts = None
+            if conn is not None:
+                key = os.path.abspath(txt_file)
+                try:
+                    st = os.stat(txt_file)
+                except OSError:
+                    st = None
+                if st is not None:
+                    seen_keys.add(key)
+                    entry = conn.execute(
+                        "SELECT size, mtime_ns, counts FROM file_counts WHERE path = ?",
+                        (key,)).fetchone()
+                    if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                        current_file_counts = json.loads(entry[2])
+                        cache_hits += 1
+                    else:
+                        current_file_counts = count_labels(txt_file)
+                        if current_file_counts is not None:
+                            updated_rows.append((key, st.st_size, st.st_mtime_ns,
+                                                 json.dumps(current_file_counts)))
+                            reparsed += 1
+                            if len(updated_rows) >= CACHE_COMMIT_INTERVAL:
+                                save_count_rows(conn, updated_rows)
+                                updated_rows = []
+            else:
+                current_file_counts = count_labels(txt_file)
+
+            if current_file_counts is None:
                 pbar.update(1)
                 continue
             
-            current_file_counts = defaultdict(int)
-            lines = content.splitlines()
-            for line in lines:
-                if line.strip():
-                    try:
-                        id_value = line.strip().split()[0]
-                        current_file_counts[id_value] += 1
-                        total_counts[id_value] += 1
-                        total_lines += 1
-                    except Exception as e:
-                        print(f"\n错误处理文件 {txt_file} 中的行: {line}, 错误信息: {e}")
+            for id_value, count in current_file_counts.items():
+                total_counts[id_value] += count
+                total_lines += count
             
             if current_file_counts:
-                file_counts[txt_file] = dict(current_file_counts)
+                if on_file is not None:
+                    on_file(txt_file, current_file_counts)
+                if keep_file_counts:
+                    file_counts[txt_file] = current_file_counts
             pbar.update(1)
             pbar.set_postfix({"总行数": total_lines})
+
+    if conn is not None:
+        # 写回剩余的新增/变化文件，并删除扫描范围内已不存在的文件
+        save_count_rows(conn, updated_rows)
+        stale_keys = [(key,) for key in iter_scope_keys(conn, path, recurse)
+                      if key not in seen_keys]
+        with conn:
+            conn.executemany("DELETE FROM file_counts WHERE path = ?", stale_keys)
+        conn.close()
+        print(f"缓存命中: {cache_hits} 个文件，重新解析: {reparsed} 个文件，"
+              f"移除失效记录: {len(stale_keys)} 条")
     
     stats = {
         'total_files': len(txt_files),
         'total_lines': total_lines,
         'total_ids': len(total_counts),
         'total_counts': dict(total_counts),
-        'file_counts': file_counts
+        'file_counts': file_counts if keep_file_counts else None
     }
     return stats
 
+def parse_annotation_array(content):
+    """
+    将标注文本解析为 (N, 9) 的数组：类别ID + 四边形顶点坐标
+
+    Returns:
+        tuple: (数组, 格式错误的行数)
+    """
+    rows = [parts for parts in (line.split() for line in content.splitlines()) if parts]
+    if not rows:
+        return np.empty((0, QUAD_FIELDS)), 0
+    malformed = 0
+    try:
+        if all(len(parts) == QUAD_FIELDS for parts in rows):
+            # 快速路径：每行字段数都正确，整体转换
+            data = np.array(rows, dtype=np.float64)
+        else:
+            raise ValueError
+    except ValueError:
+        valid_rows = []
+        for parts in rows:
+            try:
+                if len(parts) != QUAD_FIELDS:
+                    raise ValueError
+                valid_rows.append([float(x) for x in parts])
+            except ValueError:
+                malformed += 1
+        data = np.array(valid_rows, dtype=np.float64).reshape(-1, QUAD_FIELDS)
+
+    # 类别ID必须是不超过 MAX_CLASS_ID 的非负整数（按ID分配的统计数组不会被异常值撑大）
+    valid = ((data[:, 0] >= 0) & (data[:, 0] <= MAX_CLASS_ID) &
+             (data[:, 0] == np.floor(data[:, 0])))
+    malformed += int(np.count_nonzero(~valid))
+    return data[valid], malformed
+
+def _grow(array, size):
+    """将按类别索引的累加数组扩展到至少 size 行"""
+    if array.shape[0] >= size:
+        return array
+    extra = np.zeros((size - array.shape[0],) + array.shape[1:], dtype=array.dtype)
+    return np.concatenate([array, extra])
+
+class AnnotationAccumulator:
+    """按批次累加向量化统计结果，内存占用与批大小有关，与数据集规模无关"""
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.area_sum = np.zeros(0)
+        self.aspect_sum = np.zeros(0)
+        self.area_hist = np.zeros((0, len(AREA_BINS) - 1), dtype=np.int64)
+        self.aspect_hist = np.zeros((0, len(ASPECT_BINS) - 1), dtype=np.int64)
+        self.out_of_range = np.zeros(0, dtype=np.int64)
+        self.x_hist = np.zeros(len(COORD_BINS) - 1, dtype=np.int64)
+        self.y_hist = np.zeros(len(COORD_BINS) - 1, dtype=np.int64)
+        self.objects_per_image = np.zeros(0, dtype=np.int64)
+        self.out_of_range_coords = 0
+        self.malformed_lines = 0
+
+    def add_batch(self, arrays):
+        """累加一批文件的标注数组（每个文件一个数组）"""
+        per_file = np.array([len(a) for a in arrays], dtype=np.int64)
+        if per_file.size:
+            image_hist = np.bincount(per_file)
+            self.objects_per_image = _grow(self.objects_per_image, len(image_hist))
+            self.objects_per_image[:len(image_hist)] += image_hist
+
+        data = np.concatenate(arrays) if arrays else np.empty((0, QUAD_FIELDS))
+        if not len(data):
+            return
+        cls = data[:, 0].astype(np.int64)
+        xs = data[:, 1::2]
+        ys = data[:, 2::2]
+        size = int(cls.max()) + 1
+
+        # 鞋带公式计算四边形面积，外接矩形计算长宽比
+        area = 0.5 * np.abs(np.sum(xs * np.roll(ys, -1, axis=1) - np.roll(xs, -1, axis=1) * ys, axis=1))
+        width = xs.max(axis=1) - xs.min(axis=1)
+        height = ys.max(axis=1) - ys.min(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_aspect = np.log2(width / height)
+        log_aspect = np.nan_to_num(log_aspect, nan=0.0, posinf=ASPECT_BINS[-1], neginf=ASPECT_BINS[0])
+
+        coords = data[:, 1:]
+        bad_coords = (coords < 0) | (coords > 1)
+        bad_objects = bad_coords.any(axis=1)
+        self.out_of_range_coords += int(np.count_nonzero(bad_coords))
+
+        self.counts = _grow(self.counts, size)
+        self.area_sum = _grow(self.area_sum, size)
+        self.aspect_sum = _grow(self.aspect_sum, size)
+        self.area_hist = _grow(self.area_hist, size)
+        self.aspect_hist = _grow(self.aspect_hist, size)
+        self.out_of_range = _grow(self.out_of_range, size)
+
+        self.counts[:size] += np.bincount(cls, minlength=size)
+        self.area_sum[:size] += np.bincount(cls, weights=area, minlength=size)
+        self.aspect_sum[:size] += np.bincount(cls, weights=log_aspect, minlength=size)
+        self.out_of_range[:size] += np.bincount(cls, weights=bad_objects, minlength=size).astype(np.int64)
+
+        n_area = len(AREA_BINS) - 1
+        area_idx = np.clip(np.searchsorted(AREA_BINS, area, side='right') - 1, 0, n_area - 1)
+        self.area_hist[:size] += np.bincount(cls * n_area + area_idx,
+                                             minlength=size * n_area).reshape(size, n_area)
+        n_aspect = len(ASPECT_BINS) - 1
+        aspect_idx = np.clip(np.searchsorted(ASPECT_BINS, log_aspect, side='right') - 1, 0, n_aspect - 1)
+        self.aspect_hist[:size] += np.bincount(cls * n_aspect + aspect_idx,
+                                               minlength=size * n_aspect).reshape(size, n_aspect)
+
+        self.x_hist += np.histogram(np.clip(xs, 0, 1), bins=COORD_BINS)[0]
+        self.y_hist += np.histogram(np.clip(ys, 0, 1), bins=COORD_BINS)[0]
+
+    def result(self):
+        """汇总为可序列化为JSON的字典"""
+        present = np.nonzero(self.counts)[0]
+        counts = self.counts[present]
+        classes = {}
+        for i, class_id in enumerate(present):
+            classes[str(class_id)] = {
+                'count': int(counts[i]),
+                'mean_area': float(self.area_sum[class_id] / counts[i]),
+                'mean_aspect_ratio': float(2 ** (self.aspect_sum[class_id] / counts[i])),
+                'out_of_range_objects': int(self.out_of_range[class_id]),
+                'area_hist': self.area_hist[class_id].tolist(),
+                'aspect_hist': self.aspect_hist[class_id].tolist(),
+            }
+        return {
+            'total_objects': int(self.counts.sum()),
+            'malformed_lines': self.malformed_lines,
+            'out_of_range_coords': self.out_of_range_coords,
+            'classes': classes,
+            'objects_per_image': self.objects_per_image.tolist(),
+            'x_hist': self.x_hist.tolist(),
+            'y_hist': self.y_hist.tolist(),
+            'bins': {
+                'area': AREA_BINS.tolist(),
+                'log2_aspect': ASPECT_BINS.tolist(),
+                'coord': COORD_BINS.tolist(),
+            },
+        }
+
+def analyze_annotations(path, recurse=False, batch_size=10000):
+    """
+    使用NumPy向量化统计四边形标注：类别数量、面积、长宽比、坐标分布、
+    每张图片的目标数分布以及越界坐标
+
+    Args:
+        path: 输入文件或文件夹路径
+        recurse: 是否递归子文件夹
+        batch_size: 每批合并计算的文件数
+    """
+    txt_files = get_txt_files(path, recurse)
+    if not txt_files:
+        print(f"未找到任何txt文件在: {path}")
+        return None
+
+    accumulator = AnnotationAccumulator()
+    batch = []
+    for txt_file in tqdm(txt_files, desc="分析标注", colour="green"):
+        content = read_txt_file(txt_file)
+        if content is None:
+            continue
+        data, malformed = parse_annotation_array(content)
+        accumulator.malformed_lines += malformed
+        batch.append(data)
+        if len(batch) >= batch_size:
+            accumulator.add_batch(batch)
+            batch = []
+    accumulator.add_batch(batch)
+
+    analysis = accumulator.result()
+    analysis['total_files'] = len(txt_files)
+    return analysis
+
+def save_analysis(analysis, output_path):
+    """将向量化分析结果保存为JSON文件"""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(analysis, f, ensure_ascii=False, indent=2)
+
+def print_analysis(analysis):
+    """打印向量化分析结果摘要"""
+    print("\n=== 标注分析结果 ===")
+    print(f"处理文件总数: {analysis['total_files']} 个")
+    print(f"目标总数: {analysis['total_objects']} 个")
+    print(f"格式错误的行: {analysis['malformed_lines']} 行")
+    print(f"越界坐标: {analysis['out_of_range_coords']} 个")
+    print("\nID    数量      平均面积    平均长宽比  越界目标")
+    for class_id, info in sorted(analysis['classes'].items(), key=lambda x: int(x[0])):
+        print(f"{class_id:<5} {info['count']:<9} {info['mean_area']:<11.6f} "
+              f"{info['mean_aspect_ratio']:<11.3f} {info['out_of_range_objects']}")
+
 def save_statistics(stats, output_path, sort_by='id'):
     """将统计结果保存到文件"""
     with open(output_path, 'w', encoding='utf-8') as f:
@@ -95,6 +414,9 @@ def save_statistics(stats, output_path, sort_by='id'):
         for label, count in sorted_items:
             f.write(f"ID {label}: {count} 次\n")
         
+        if stats['file_counts'] is None:
+            return
+
         f.write("\n\n=== 按文件统计 ===\n")
         for file, counts in stats['file_counts'].items():
             f.write(f"\n文件: {file}\n")
@@ -105,6 +427,37 @@ def save_statistics(stats, output_path, sort_by='id'):
             for label, count in sorted_counts:
                 f.write(f"ID {label}: {count} 次\n")
 
+def sort_counts(counts, sort_by='id'):
+    """按ID从小到大或按数量从大到小排序计数项"""
+    if sort_by == 'id':
+        return sorted(counts.items(), key=lambda x: int(x[0]))
+    return sorted(counts.items(), key=lambda x: -x[1])
+
+def open_file_rows_writer(output_path, fmt, sort_by='id'):
+    """
+    打开按文件统计的流式输出
+
+    Args:
+        output_path: 输出文件路径
+        fmt: 'csv'（每行 file,id,count）或 'jsonl'（每行一个文件的JSON对象）
+        sort_by: 文件内ID的排序方式
+    Returns:
+        tuple: (文件对象, write(文件路径, 计数字典) 函数)
+    """
+    f = open(output_path, 'w', encoding='utf-8', newline='')
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(['file', 'id', 'count'])
+
+        def write(txt_file, counts):
+            writer.writerows((txt_file, label, count) for label, count in sort_counts(counts, sort_by))
+    else:
+        def write(txt_file, counts):
+            f.write(json.dumps({'file': txt_file, 'counts': dict(sort_counts(counts, sort_by))},
+                               ensure_ascii=False))
+            f.write('\n')
+    return f, write
+
 def get_default_output_path(input_path, output_path):
     """生成默认的输出文件路径"""
     input_path = os.path.normpath(input_path)
@@ -131,6 +484,15 @@ def main():
                         help='排序方式：id（按ID从小到大，默认）或 count（按数量从大到小）')
     parser.add_argument('--silent', action='store_true', help='不打印统计结果到控制台')
     parser.add_argument('--recurse', action='store_true', help='递归遍历子文件夹')
+    parser.add_argument('--analyze', action='store_true',
+                        help='向量化分析四边形标注（面积、长宽比、坐标分布等），结果保存为JSON')
+    parser.add_argument('--format', choices=['txt', 'csv', 'jsonl'], default='txt',
+                        help='按文件统计的输出格式：txt（写入报告，默认）、csv 或 jsonl（边统计边流式写出）')
+    parser.add_argument('--no-per-file', action='store_true',
+                        help='不输出按文件统计，只保留总体统计')
+    parser.add_argument('--cache', action='store_true',
+                        help='启用增量统计缓存，仅重新解析新增或修改过的文件')
+    parser.add_argument('--cache-file', help='缓存文件路径（默认与输出文件放在一起）')
     args = parser.parse_args()
 
     if not os.path.exists(args.input_path):
@@ -145,7 +507,36 @@ def main():
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
 
-    stats = statistic(args.input_path, recurse=args.recurse)
+    if args.analyze:
+        analysis = analyze_annotations(args.input_path, recurse=args.recurse)
+        if analysis is None:
+            return
+        analysis_path = os.path.splitext(output_path)[0] + "_analysis.json"
+        save_analysis(analysis, analysis_path)
+        if not args.silent:
+            print_analysis(analysis)
+            print(f"\n分析结果已保存至: {os.path.abspath(analysis_path)}")
+        return
+
+    cache_path = None
+    if args.cache or args.cache_file:
+        cache_path = args.cache_file or get_default_cache_path(output_path)
+        print(f"缓存文件: {cache_path}")
+
+    # csv/jsonl 模式下按文件统计边产生边写出，内存中只保留总体计数
+    rows_file = None
+    on_file = None
+    rows_path = None
+    if args.format != 'txt' and not args.no_per_file:
+        rows_path = f"{os.path.splitext(output_path)[0]}_files.{args.format}"
+        rows_file, on_file = open_file_rows_writer(rows_path, args.format, args.sort_by)
+    try:
+        stats = statistic(args.input_path, recurse=args.recurse, cache_path=cache_path,
+                          on_file=on_file,
+                          keep_file_counts=args.format == 'txt' and not args.no_per_file)
+    finally:
+        if rows_file is not None:
+            rows_file.close()
     if stats is None:
         return
 
@@ -167,6 +558,8 @@ def main():
         for label, count in sorted_items:
             print(f"ID {label}: {count} 次")
         print(f"\n统计结果已保存至: {os.path.abspath(output_path)}")
+        if rows_path:
+            print(f"按文件统计已保存至: {os.path.abspath(rows_path)}")
 
 if __name__ == "__main__":
     main()
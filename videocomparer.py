@@ -1,9 +1,165 @@
 import cv2 as cv
 import numpy as np
 import argparse
+import queue
+import threading
+import time
+
+# 帧数和内存都不限制时缓冲区使用的默认内存上限（MB），保证长时间播放时内存有界
+DEFAULT_BUFFER_MB = 1024
+
+class FrameReader:
+    """
+    后台解码线程：从单个视频中连续读取帧并缩放，放入有界队列
+    
+    VideoCapture 只在该线程中访问；跳转请求通过 seek() 交给线程执行，
+    每次跳转递增 generation，跳转前已入队的旧帧在读取时被丢弃。
+    """
+    
+    def __init__(self, cap, max_width, max_height, queue_size=8):
+        """
+        Args:
+            cap: 已打开的 cv.VideoCapture
+            max_width: 缩放后的最大宽度
+            max_height: 缩放后的最大高度
+            queue_size: 已解码帧队列的长度
+        """
+        self.cap = cap
+        self.max_width = max_width
+        self.max_height = max_height
+        self.frames = queue.Queue(maxsize=max(1, queue_size))
+        self.generation = 0
+        self.seek_target = None
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def resize(self, frame):
+        """等比缩放到指定区域内"""
+        scale = min(self.max_width / frame.shape[1], self.max_height / frame.shape[0])
+        width = int(frame.shape[1] * scale)
+        height = int(frame.shape[0] * scale)
+        return cv.resize(frame, (width, height))
+    
+    def _put(self, item):
+        """放入队列；队列已满时等待，期间收到跳转或停止请求则放弃该帧"""
+        while not self.stopped and self.seek_target is None:
+            try:
+                self.frames.put(item, timeout=0.05)
+                return
+            except queue.Full:
+                continue
+    
+    def _run(self):
+        index = 0
+        generation = 0
+        while True:
+            with self.cond:
+                if self.stopped:
+                    return
+                if self.seek_target is not None:
+                    index = self.seek_target
+                    generation = self.generation
+                    self.seek_target = None
+                    self.cap.set(cv.CAP_PROP_POS_FRAMES, index)
+            
+            ret, frame = self.cap.read()
+            if not ret:
+                # 到达结尾：放入结束标记后等待下一次跳转
+                self._put((generation, index, None))
+                with self.cond:
+                    while not self.stopped and self.seek_target is None:
+                        self.cond.wait()
+                continue
+            
+            self._put((generation, index, self.resize(frame)))
+            index += 1
+    
+    def seek(self, target):
+        """请求跳转到指定帧，并清空队列中的旧帧"""
+        with self.cond:
+            self.generation += 1
+            self.seek_target = target
+            self.cond.notify()
+        self._drain()
+    
+    def _drain(self):
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                return
+    
+    def get(self):
+        """
+        取出下一帧（阻塞）
+        
+        Returns:
+            tuple: (帧序号, 帧)，到达视频结尾时帧为None
+        """
+        while True:
+            generation, index, frame = self.frames.get()
+            if generation == self.generation:
+                return index, frame
+    
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self._drain()
+        self.thread.join(timeout=1)
+
+class FrameRing:
+    """
+    已解码帧的环形缓冲区，保存当前位置附近的帧对
+
+    容量可以按帧数或占用内存（MB）限制，两者都未指定时按 DEFAULT_BUFFER_MB 限制；
+    超出时优先淘汰离当前位置最远的帧，因此单帧后退和反向播放在缓冲范围内无需跳转解码。
+    """
+    
+    def __init__(self, max_frames=60, max_mb=None):
+        if not max_frames and not max_mb:
+            max_mb = DEFAULT_BUFFER_MB
+        self.max_frames = max_frames
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.frames = {}
+        self.used_bytes = 0
+        self.center = 0
+    
+    def __contains__(self, index):
+        return index in self.frames
+    
+    def get(self, index):
+        return self.frames.get(index)
+    
+    def put(self, index, pair):
+        if index in self.frames:
+            self.used_bytes -= sum(f.nbytes for f in self.frames[index])
+        self.frames[index] = pair
+        self.used_bytes += sum(f.nbytes for f in pair)
+        self._evict()
+    
+    def _over_budget(self):
+        return ((self.max_frames and len(self.frames) > self.max_frames) or
+                (self.max_bytes and self.used_bytes > self.max_bytes))
+    
+    def _evict(self):
+        while len(self.frames) > 1 and self._over_budget():
+            farthest = max(self.frames, key=lambda i: abs(i - self.center))
+            self.used_bytes -= sum(f.nbytes for f in self.frames.pop(farthest))
+    
+    def capacity_hint(self):
+        """按当前帧大小估算缓冲区能容纳的帧数"""
+        if not self.frames or not self.max_bytes:
+            return self.max_frames or float('inf')
+        per_frame = max(1, self.used_bytes // len(self.frames))
+        frames = self.max_bytes // per_frame
+        return max(1, min(frames, self.max_frames) if self.max_frames else frames)
 
 class VideoComparer:
-    def __init__(self, video1_path, video2_path):
+    def __init__(self, video1_path, video2_path, queue_size=8, buffer_frames=60,
+                 buffer_mb=None, refill=16):
         """初始化视频对比器"""
         self.cap1 = cv.VideoCapture(video1_path)
         self.cap2 = cv.VideoCapture(video2_path)
@@ -30,25 +186,79 @@ class VideoComparer:
         self.window_width = 2560
         self.window_height = 720
         cv.resizeWindow(self.window_name, self.window_width, self.window_height)
-
+        
+        # 两个视频分别在后台线程中解码和缩放
+        self.reader1 = FrameReader(self.cap1, self.window_width / 2, self.window_height, queue_size)
+        self.reader2 = FrameReader(self.cap2, self.window_width / 2, self.window_height, queue_size)
+        self.next_read = 0  # 解码线程接下来将送出的帧序号
+        
+        # 当前位置附近已解码帧的缓冲区；向后取不到时按批从更早的位置重新解码
+        self.ring = FrameRing(buffer_frames, buffer_mb)
+        self.refill = max(1, refill)
+        self.target_frame = 0
+    
     def on_trackbar(self, value):
         """进度条回调函数"""
-        self.current_frame = value
-        self.cap1.set(cv.CAP_PROP_POS_FRAMES, value)
-        self.cap2.set(cv.CAP_PROP_POS_FRAMES, value)
+        # 播放时更新进度条也会触发回调，位置未变化时无需跳转
+        if value == self.current_frame:
+            return
+        self.target_frame = value
+    
+    def seek(self, target):
+        """让两个解码线程从指定帧开始解码"""
+        self.reader1.seek(target)
+        self.reader2.seek(target)
+        self.next_read = target
+    
+    def get_frame(self, index):
+        """
+        获取指定帧对：优先从缓冲区读取，其次顺序读取解码队列，最后才跳转
 
-    def read_and_resize(self, cap):
-        """读取并调整图像大小"""
-        ret, frame = cap.read()
-        if ret:
-            # 计算缩放比例
-            scale = min(self.window_width/2 / frame.shape[1], 
-                       self.window_height / frame.shape[0])
-            width = int(frame.shape[1] * scale)
-            height = int(frame.shape[0] * scale)
-            frame = cv.resize(frame, (width, height))
-        return ret, frame
+        向后取帧且不在缓冲区中时，从 index 之前一批帧的位置开始解码，
+        一次补充多帧，后续的后退和反向播放直接从缓冲区读取。
 
+        Returns:
+            tuple: (帧1, 帧2)，到达视频结尾时返回None
+        """
+        self.ring.center = index
+        if index in self.ring:
+            return self.ring.get(index)
+        
+        # 目标在解码位置之后不远处时顺序读过去，比跳转到关键帧更快
+        if not self.next_read <= index <= self.next_read + self.refill:
+            start = index
+            if index < self.current_frame:
+                batch = min(self.refill, self.ring.capacity_hint())
+                start = max(0, index - batch + 1)
+            self.seek(start)
+        
+        while self.next_read <= index:
+            pair = self.next_pair()
+            if pair is None:
+                return None
+            frame_index, frame1, frame2 = pair
+            self.ring.put(frame_index, (frame1, frame2))
+            self.next_read = frame_index + 1
+        return self.ring.get(index)
+    
+    def next_pair(self):
+        """
+        从两个解码队列中取出帧序号相同的一对帧
+        
+        Returns:
+            tuple: (帧序号, 帧1, 帧2)，任一视频到达结尾时返回None
+        """
+        index1, frame1 = self.reader1.get()
+        index2, frame2 = self.reader2.get()
+        while frame1 is not None and frame2 is not None and index1 != index2:
+            if index1 < index2:
+                index1, frame1 = self.reader1.get()
+            else:
+                index2, frame2 = self.reader2.get()
+        if frame1 is None or frame2 is None:
+            return None
+        return index1, frame1, frame2
+    
     def run(self):
         """运行视频对比器"""
         print("\n控制说明:")
@@ -58,34 +268,51 @@ class VideoComparer:
         print("数字键1-9: 跳转到视频的相应位置(10%-90%)")
         print("Q: 退出\n")
         
+        # 按视频原始帧率控制播放速度
+        fps = self.fps1 if self.fps1 and self.fps1 > 0 else 30
+        frame_interval = 1000.0 / fps
+        shown_at = time.time()
+        
+        shown_frame = None
         while True:
-            if self.current_frame >= self.total_frames or self.current_frame < 0:
-                self.current_frame = 0
-                self.cap1.set(cv.CAP_PROP_POS_FRAMES, 0)
-                self.cap2.set(cv.CAP_PROP_POS_FRAMES, 0)
-
-            # 读取两个视频的当前帧
-            ret1, frame1 = self.read_and_resize(self.cap1)
-            ret2, frame2 = self.read_and_resize(self.cap2)
-
-            if ret1 and ret2:
+            if self.target_frame >= self.total_frames or self.target_frame < 0:
+                self.target_frame = 0
+            
+            if self.target_frame != shown_frame:
+                pair = self.get_frame(self.target_frame)
+                if pair is None:
+                    # 任一视频提前结束，从头开始
+                    if self.target_frame == 0:
+                        break
+                    self.target_frame = 0
+                    continue
+                self.current_frame = shown_frame = self.target_frame
+                frame1, frame2 = pair
+                
+                # 两个画面高度不同时补齐后合并（缓冲区中的帧保持不变）
+                height = max(frame1.shape[0], frame2.shape[0])
+                frame1, frame2 = [cv.copyMakeBorder(f, 0, height - f.shape[0], 0, 0, cv.BORDER_CONSTANT)
+                                  if f.shape[0] < height else f for f in (frame1, frame2)]
+                combined = np.hstack((frame1, frame2))
+                
                 # 添加帧信息
                 frame_info = f"Frame: {self.current_frame}/{self.total_frames}"
-                for frame in [frame1, frame2]:
-                    cv.putText(frame, frame_info, (10, 30), 
+                for x in [10, frame1.shape[1] + 10]:
+                    cv.putText(combined, frame_info, (x, 30),
                              cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-
-                # 合并两个画面
-                combined = np.hstack((frame1, frame2))
                 cv.imshow(self.window_name, combined)
                 
                 # 更新进度条
                 cv.setTrackbarPos('Frame', self.window_name, self.current_frame)
+            
+            # 处理按键事件；播放时扣除解码和显示已用去的时间
+            if self.is_playing:
+                elapsed = (time.time() - shown_at) * 1000
+                delay = max(1, int(frame_interval - elapsed))
             else:
-                break
-
-            # 处理按键事件
-            key = cv.waitKey(0 if not self.is_playing else 30) & 0xFF
+                delay = 30  # 暂停时仍需轮询，以便响应进度条拖动
+            key = cv.waitKey(delay) & 0xFF
+            shown_at = time.time()
             
             if key == ord('q'):  # 退出
                 break
@@ -97,26 +324,24 @@ class VideoComparer:
             elif key == ord('d'):  # 正向播放
                 self.step = 1
                 self.is_playing = True
-            elif key == 81:  # 左方向键，上一帧
-                self.current_frame = max(0, self.current_frame - 1)
-                self.cap1.set(cv.CAP_PROP_POS_FRAMES, self.current_frame)
-                self.cap2.set(cv.CAP_PROP_POS_FRAMES, self.current_frame)
+            elif key == 81:  # 左方向键，上一帧（缓冲区内无需跳转）
+                self.target_frame = max(0, self.current_frame - 1)
             elif key == 83:  # 右方向键，下一帧
-                self.current_frame = min(self.total_frames - 1, self.current_frame + 1)
-                self.cap1.set(cv.CAP_PROP_POS_FRAMES, self.current_frame)
-                self.cap2.set(cv.CAP_PROP_POS_FRAMES, self.current_frame)
+                self.target_frame = min(self.total_frames - 1, self.current_frame + 1)
             elif ord('1') <= key <= ord('9'):  # 跳转到指定位置
                 pos = (key - ord('0')) * 0.1
-                target_frame = int(self.total_frames * pos)
-                self.current_frame = target_frame
-                self.cap1.set(cv.CAP_PROP_POS_FRAMES, target_frame)
-                self.cap2.set(cv.CAP_PROP_POS_FRAMES, target_frame)
+                self.target_frame = int(self.total_frames * pos)
             
-            # 如果正在播放，更新帧
-            if self.is_playing:
-                self.current_frame += self.step
-
+            # 如果正在播放且没有其他跳转，更新帧
+            if self.is_playing and self.target_frame == self.current_frame:
+                if self.step < 0 and self.current_frame == 0:
+                    self.is_playing = False  # 反向播放到开头后暂停
+                else:
+                    self.target_frame = self.current_frame + self.step
+        
         # 清理资源
+        self.reader1.stop()
+        self.reader2.stop()
         self.cap1.release()
         self.cap2.release()
         cv.destroyAllWindows()
@@ -127,9 +352,19 @@ def parse_args():
                       help="第一个视频文件路径")
     parser.add_argument("--video2", "-v2", type=str, required=True,
                       help="第二个视频文件路径")
+    parser.add_argument("--queue-size", type=int, default=8,
+                      help="每个视频预先解码的帧数（默认8）")
+    parser.add_argument("--buffer-frames", type=int, default=60,
+                      help=f"缓冲区保留的已解码帧数，用于后退和反向播放（默认60，0表示不按帧数限制；"
+                           f"此时未指定 --buffer-mb 则按 {DEFAULT_BUFFER_MB}MB 限制）")
+    parser.add_argument("--buffer-mb", type=float, default=None,
+                      help="缓冲区占用的内存上限（MB），默认不限")
+    parser.add_argument("--refill", type=int, default=16,
+                      help="后退超出缓冲区时一次补充解码的帧数（默认16）")
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_args()
-    comparer = VideoComparer(args.video1, args.video2)
+    comparer = VideoComparer(args.video1, args.video2, args.queue_size,
+                             args.buffer_frames or None, args.buffer_mb, args.refill)
     comparer.run()
\ No newline at end of file